@@ -1,10 +1,48 @@
 import time
 import hashlib
 from collections import OrderedDict
+from UTXOSet import UTXO
+
+
+def serialize(value):
+    # unambiguous byte form of a transaction's fields (every item is length prefixed)
+    if isinstance(value, bytes):
+        data = value
+    elif isinstance(value, (dict, UTXO)):
+        data = b''.join(serialize(k) + serialize(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        data = b''.join(serialize(x) for x in value)
+    else:
+        data = str(value).encode()
+    return str(len(data)).encode() + b':' + data
+
+
+def merkle_root(transactions):
+    # hash every transaction once and then hash pairs up to the root. An odd last node moves up a level as it
+    # is instead of being paired with itself, so that [a, b, c] and [a, b, c, c] have different roots, and
+    # leaves are hashed apart from pairs (a 0 or 1 byte first), so that a pair can't pass for a transaction
+    level = [hashlib.sha256(b'\x00' + serialize(t.to_dict() if hasattr(t, 'to_dict') else t)).digest()
+             for t in transactions]
+    if not level:
+        return hashlib.sha256(b'').hexdigest()
+    while len(level) > 1:
+        level = [hashlib.sha256(b'\x01' + level[i] + level[i + 1]).digest() if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def target(difficulty):
+    # a hash meets a difficulty of d leading zero bits (fractions of a bit too) if it's below 2 ** (256 - d),
+    # a difficulty of 4k bits is a hex digest starting with k zeros
+    return int(2 ** (256 - difficulty))
 
 
 class Block:
-    def __init__(self, index, previousHash=1, nonce=0, listOfTransactions=None):
+    # no per instance dict, and once mined (sealed) only the cached digests can change
+    __slots__ = ('index', 'previousHash', 'listOfTransactions', 'nonce', 'timestamp', 'difficulty', 'hash',
+                 '_merkle_root', '_midstate', '_sealed')
+
+    def __init__(self, index, previousHash=1, nonce=0, listOfTransactions=None, difficulty=0):
         if listOfTransactions is None:
             listOfTransactions = []
         self.index = index
@@ -12,23 +50,76 @@ class Block:
         self.listOfTransactions = listOfTransactions
         self.nonce = nonce
         self.timestamp = time.time()
+        self.difficulty = difficulty    # set when mining starts
+        self._merkle_root = None
+        self._midstate = None
+        self._sealed = False
         self.hash = self.myHash()
 
+    def __setattr__(self, name, value):
+        if name not in ('_merkle_root', '_midstate') and getattr(self, '_sealed', False):
+            raise AttributeError('A mined block cannot be modified')
+        object.__setattr__(self, name, value)
+
+    def seal(self):
+        # called once the block is mined, its transactions can't change anymore either
+        self.listOfTransactions = tuple(self.listOfTransactions)
+        self._sealed = True
+        return self
+
+    def merkle_root(self):
+        # the transactions are committed to the header only through their merkle root
+        if self._merkle_root is None:
+            self._merkle_root = merkle_root(self.listOfTransactions)
+        return self._merkle_root
+
+    def header(self):
+        # everything hashed before the nonce, it doesn't change while mining
+        return (str(self.index) + '|' + str(self.previousHash) + '|' + str(self.timestamp) + '|' +
+                str(float(self.difficulty)) + '|' + self.merkle_root() + '|').encode()
+
+    def midstate(self):
+        # sha256 state after consuming the header, computed once per header
+        header = self.header()
+        if self._midstate is None or self._midstate[0] != header:
+            self._midstate = (header, hashlib.sha256(header))
+        return self._midstate[1]
+
     def myHash(self):
-        # calculate self.hash
-        s = (str(self.index) + str(self.previousHash) + str(self.timestamp) + str(self.listOfTransactions) + str(
-            self.nonce)).encode()               # convert string to bytes
-        return hashlib.sha256(s).hexdigest()    # return hex value of hashed data
+        # calculate self.hash, only the nonce is hashed on top of the midstate
+        s = self.midstate().copy()
+        s.update(str(self.nonce).encode())
+        return s.hexdigest()    # return hex value of hashed data
+
+    def mined(self):
+        # whether the hash meets the difficulty of the block, a block is given a difficulty when mining starts
+        return bool(self.difficulty) and int(self.hash, 16) < target(self.difficulty)
 
     def add_transaction(self, transaction):
         # add a transaction to the block
         self.listOfTransactions.append(transaction)
+        self._merkle_root = None
+
+    def __getstate__(self):
+        # cached digests are never sent, receivers compute them on their own
+        return {name: getattr(self, name) for name in ('index', 'previousHash', 'listOfTransactions', 'nonce',
+                                                       'timestamp', 'difficulty', 'hash')}
+
+    def __setstate__(self, state):
+        # a received block has been mined already
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, '_merkle_root', None)
+        object.__setattr__(self, '_midstate', None)
+        object.__setattr__(self, '_sealed', False)
+        self.seal()
 
     def __eq__(self, other):
         if isinstance(other, Block):
             return self.index == other.index and self.previousHash == other.previousHash and \
-                   self.listOfTransactions == other.listOfTransactions and self.nonce == other.nonce and \
-                   self.timestamp == other.timestamp and self.hash == other.hash
+                   tuple(self.listOfTransactions) == tuple(other.listOfTransactions) and self.nonce == other.nonce and \
+                   self.timestamp == other.timestamp and self.difficulty == other.difficulty and \
+                   self.hash == other.hash
         return False
 
     def to_dict(self):
@@ -38,5 +129,6 @@ class Block:
             'listOfTransactions': self.listOfTransactions,
             'nonce': self.nonce,
             'timestamp': self.timestamp,
+            'difficulty': self.difficulty,
             'hash': self.hash
         })
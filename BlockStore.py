@@ -0,0 +1,188 @@
+import mmap
+import os
+import struct
+import threading
+from Wire import MAGIC, VERSION, CHAIN, BLOCKS, Reader, read_block, block_record, chain_message
+
+# the segment starts with the version of the wire format its records are written in
+HEADER = MAGIC + struct.pack('!B', VERSION)
+# an entry of the index: where the record of a block starts in the segment and the hash of the block
+ENTRY = struct.Struct('!Q32s')
+
+
+class BlockStore:
+    """
+        The blocks of a chain on disk: an append-only segment file of their records in the wire format (the
+        ones of a CHAIN message) and an index file of the offset and hash of every block by height. Records
+        are read through a memory map, so that serving a range of blocks neither decodes nor keeps them.
+        It has the same interface as ChainCache, and the node keeps it in sync with its chain the same way.
+        Records are flushed to the disk (fsync) before their index entries are written, and the records are
+        decoded when the store is loaded, dropping everything from the first one which was lost or only
+        partly written before a crash
+
+        Attributes
+        ----------
+        path : str
+            the segment file, the index is path + '.index'
+        offsets : list[int]
+            where the record of every block starts in the segment, by height
+        hashes : list[str]
+            the hash of every block, by height
+        size : int
+            the length of the segment, up to the end of the last record
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.offsets = []
+        self.hashes = []
+        self.size = len(HEADER)
+        self.map = None
+        self.segment = open(path, 'a+b')
+        self.index = open(path + '.index', 'a+b')
+        self.load()
+
+    def load(self):
+        # reads the index, dropping the entries from the first one whose record doesn't decode to a block with
+        # the hash of the entry, which wasn't written completely before a crash
+        self.segment.seek(0)
+        if self.segment.read(len(HEADER)) != HEADER:
+            if os.path.getsize(self.path):
+                print(f'Discarding {self.path}, written by another version')
+            self.segment.truncate(0)
+            self.index.truncate(0)
+            self.segment.write(HEADER)
+            self.segment.flush()
+            return
+        segment_size = os.path.getsize(self.path)
+        self.index.seek(0)
+        data = self.index.read()
+        for offset, digest in ENTRY.iter_unpack(data[:len(data) - len(data) % ENTRY.size]):
+            if offset != self.size or offset + 4 > segment_size:
+                break
+            self.segment.seek(offset)
+            end = offset + 4 + struct.unpack('!I', self.segment.read(4))[0]
+            if end > segment_size or not self.intact(self.segment.read(end - offset - 4), digest, len(self)):
+                break
+            self.offsets.append(offset)
+            self.hashes.append(digest.hex())
+            self.size = end
+        self.segment.truncate(self.size)
+        self.index.truncate(len(self.offsets) * ENTRY.size)
+
+    @staticmethod
+    def intact(record, digest, height):
+        # whether record is the one of a block whose hash is digest
+        try:
+            r = Reader(record)
+            block = read_block(r, height == 0)
+            r.end()
+        except ValueError:
+            return False
+        return block.hash == digest.hex()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def append(self, blocks):
+        # the index entries are written once the records are on the disk, so that an entry never points at a
+        # record which was lost
+        entries = []
+        for block in blocks:
+            record = block_record(block)
+            self.segment.write(record)
+            entries.append(ENTRY.pack(self.size, bytes.fromhex(block.hash)))
+            self.offsets.append(self.size)
+            self.hashes.append(block.hash)
+            self.size += len(record)
+        self.segment.flush()
+        os.fsync(self.segment.fileno())
+        self.index.write(b''.join(entries))
+        self.index.flush()
+        os.fsync(self.index.fileno())
+
+    def truncate(self, length):
+        # drops the blocks after the first length ones, their index entries first
+        if length >= len(self.hashes):
+            return
+        self.size = self.offsets[length]
+        del self.offsets[length:]
+        del self.hashes[length:]
+        self.index.truncate(length * ENTRY.size)
+        os.fsync(self.index.fileno())
+        self.segment.truncate(self.size)
+
+    def sync(self, blocks, length):
+        # keeps the stored blocks which are common with blocks[:length] and appends the rest (run by the store
+        # thread of the node), equal hashes at a position mean equal prefixes as in ChainCache
+        with self.lock:
+            common = min(len(self.hashes), length)
+            while common and self.hashes[common - 1] != blocks[common - 1].hash:
+                common -= 1
+            self.truncate(common)
+            if common < length:
+                self.append(blocks[common:length])
+
+    def common(self, blocks):
+        # how many blocks at the start of blocks are stored
+        with self.lock:
+            common = min(len(self.hashes), len(blocks))
+            while common and self.hashes[common - 1] != blocks[common - 1].hash:
+                common -= 1
+            return common
+
+    def view(self):
+        # the segment mapped in memory (lock held), mapped again once it has grown past the mapping. Only the
+        # first size bytes are read, an older mapping may be longer than the file after truncate
+        if self.map is None or len(self.map) < self.size:
+            self.map = mmap.mmap(self.segment.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+    def end(self, height):
+        return self.offsets[height + 1] if height + 1 < len(self.offsets) else self.size
+
+    def records(self, start, stop):
+        # a copy of the records of the blocks from start to stop (lock held)
+        if start >= stop:
+            return b''
+        return self.view()[self.offsets[start]:self.end(stop - 1)]
+
+    def block(self, height):
+        # the block at height, decoded from its record
+        with self.lock:
+            r = Reader(self.view()[self.offsets[height] + 4:self.end(height)])
+            block = read_block(r, height == 0)
+        r.end()
+        return block
+
+    def read(self, start=0, stop=None):
+        # the blocks from start to stop, decoded one at a time
+        for height in range(start, len(self) if stop is None else stop):
+            yield self.block(height)
+
+    def stored(self, blocks, length):
+        # whether the first length blocks are the stored ones (lock held), readers may hold a snapshot from
+        # before the last sync
+        return length <= len(self.hashes) and (not length or self.hashes[length - 1] == blocks[length - 1].hash)
+
+    def chain(self, blocks, length):
+        # the chain message of blocks[:length]
+        with self.lock:
+            if self.stored(blocks, length):
+                return chain_message(CHAIN, length, self.records(0, length))
+        return chain_message(CHAIN, length, b''.join(block_record(x) for x in blocks[:length]))
+
+    def blocks(self, blocks, length, start):
+        # the blocks message of blocks[start:length]
+        if start >= length:
+            return chain_message(BLOCKS, 0, b'')
+        with self.lock:
+            if self.stored(blocks, length):
+                return chain_message(BLOCKS, length - start, self.records(start, length))
+        return chain_message(BLOCKS, length - start, b''.join(block_record(x) for x in blocks[start:length]))
+
+    def close(self):
+        with self.lock:
+            self.segment.close()
+            self.index.close()
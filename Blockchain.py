@@ -1,3 +1,4 @@
+import math
 import time
 import os
 import uuid
@@ -5,34 +6,58 @@ from dotenv import load_dotenv
 from Crypto.Hash import SHA256
 from Block import Block
 from collections import OrderedDict
+from UTXOSet import UTXO
 
 load_dotenv()
 N = int(os.getenv("N"))
+MINING_DIFFICULTY = int(os.getenv("MINING_DIFFICULTY"))
+if MINING_DIFFICULTY < 1:
+    # a difficulty of 0 would make every hash valid, including the one of a block before it is mined
+    raise ValueError(f'MINING_DIFFICULTY must be at least 1, not {MINING_DIFFICULTY}')
+TARGET_BLOCK_INTERVAL = float(os.getenv("TARGET_BLOCK_INTERVAL", 0))
+RETARGET_WINDOW = int(os.getenv("RETARGET_WINDOW", 10))
+# difficulties are in leading zero bits of a block's hash, a hex zero of MINING_DIFFICULTY is 4 of them
+INITIAL_DIFFICULTY = 4.0 * MINING_DIFFICULTY
+# difficulties are multiples of DIFFICULTY_STEP bits, which change by at most MAX_RETARGET bits from a block to
+# the next one and never drop below MIN_DIFFICULTY bits
+DIFFICULTY_STEP = 1 / 16
+MAX_RETARGET = 1
+MIN_DIFFICULTY = 1.0
+# seconds a block's timestamp may be ahead of the clock of a node which validates it
+MAX_CLOCK_DRIFT = 60
 
 
 class Blockchain:
     def __init__(self, node):
         self.chain = self.build_genesis(node)
+        self.transaction_ids = set()    # ids of transactions confirmed after genesis
+        self.heights = {}               # position of every block in the chain by its hash
+        self.rebuild_index()
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        # a chain received from another node
+        chain = cls.__new__(cls)
+        chain.__setstate__({'chain': list(blocks)})
+        return chain
 
     def build_genesis(self, node):
         if node.id == 0:
             times = time.time()
-            trans_id = SHA256.new(('0' + node.wallet.to_dict()['public_key'].decode('utf-8')
-                                   + str(100 * N) + str(times)).encode()).hexdigest()
+            trans_id = SHA256.new(('0' + node.wallet.address + str(100 * N) + str(times)).encode()).hexdigest()
             trans = OrderedDict({
                 'transaction_id': trans_id,
                 'sender_address': 0,
-                'receiver_address': node.wallet.to_dict()['public_key'],
+                'receiver_address': node.wallet.address,
                 'amount': 100 * N,
                 'timestamp': times,
-                'transaction_outputs': [OrderedDict({'id': uuid.uuid4(),
-                                                     'transaction_id': trans_id,
-                                                     'receiver': node.wallet.to_dict()['public_key'],
-                                                     'amount': 100 * N})]
+                'transaction_outputs': [UTXO(uuid.uuid4().bytes, trans_id, node.wallet.address, 100 * N,
+                                             genesis=True)]
             })
-            block = Block(index=1, previousHash=1)
+            block = Block(index=1, previousHash=1, difficulty=INITIAL_DIFFICULTY)
             block.add_transaction(trans)
-            node.NBCs[node.wallet.to_dict()['public_key']] = [trans['transaction_outputs'][0]]
+            block.seal()
+            node.NBCs.add(trans['transaction_outputs'][0])
             node.wallet.balance += 100 * N
             node.block = Block(index=2, previousHash=block.hash)
             return [block]
@@ -47,6 +72,70 @@ class Blockchain:
 
     def add_block(self, block):
         self.chain.append(block)
+        self.heights[block.hash] = len(self.chain) - 1
+        self.transaction_ids.update(t.transaction_id for t in block.listOfTransactions)
+
+    def truncate(self, length):
+        # drops and returns the blocks after the first length ones, copying the list instead of
+        # modifying it in place, since published snapshots share it
+        removed = self.chain[length:]
+        for block in removed:
+            del self.heights[block.hash]
+            self.transaction_ids.difference_update(t.transaction_id for t in block.listOfTransactions)
+        self.chain = self.chain[:length]
+        return removed
+
+    def next_difficulty(self):
+        # difficulty of the block after the last one, fixed to INITIAL_DIFFICULTY without TARGET_BLOCK_INTERVAL.
+        # Otherwise the mean difficulty of the last RETARGET_WINDOW blocks is raised by a bit for every halving
+        # of TARGET_BLOCK_INTERVAL their mean interval is short of, and lowered likewise. Genesis is created
+        # long before the first block, so intervals are measured from the first block on.
+        tip = self.chain[-1]
+        if not TARGET_BLOCK_INTERVAL:
+            return INITIAL_DIFFICULTY
+        window = self.chain[max(1, len(self.chain) - RETARGET_WINDOW - 1):]
+        if len(window) < 2:
+            return tip.difficulty
+        interval = max((window[-1].timestamp - window[0].timestamp) / (len(window) - 1), 1e-6)
+        mean = sum(x.difficulty for x in window[:-1]) / (len(window) - 1)
+        wanted = mean + math.log2(TARGET_BLOCK_INTERVAL / interval)
+        wanted = min(max(wanted, tip.difficulty - MAX_RETARGET), tip.difficulty + MAX_RETARGET)
+        return max(MIN_DIFFICULTY, round(wanted / DIFFICULTY_STEP) * DIFFICULTY_STEP)
+
+    def contains_transaction(self, transaction_id):
+        return transaction_id in self.transaction_ids
+
+    def rebuild_index(self):
+        self.transaction_ids = set(t.transaction_id for block in self.chain[1:] for t in block.listOfTransactions)
+        self.heights = {block.hash: i for i, block in enumerate(self.chain)}
+
+    def locator(self):
+        # hashes of the last 10 blocks and then of blocks exponentially further back, down to genesis
+        positions = []
+        step = 1
+        i = len(self.chain) - 1
+        while i > 0:
+            positions.append(i)
+            if len(positions) >= 10:
+                step *= 2
+            i -= step
+        positions.append(0)
+        return [self.chain[i].hash for i in positions] if self.chain else []
+
+    def fork_point(self, locator):
+        # position of the last block which is also in the locator of another chain (-1 if none)
+        for block_hash in locator:
+            if block_hash in self.heights:
+                return self.heights[block_hash]
+        return -1
+
+    def __getstate__(self):
+        # the index is not sent, receivers rebuild it from the blocks
+        return {'chain': self.chain}
+
+    def __setstate__(self, state):
+        self.chain = state['chain']
+        self.rebuild_index()
 
     def __eq__(self, other):
         if isinstance(other, Blockchain):
@@ -0,0 +1,63 @@
+import threading
+from Wire import CHAIN, BLOCKS, block_record, chain_message
+
+
+class ChainCache:
+    """
+        The encoded blocks of a chain, extended block by block as the chain grows instead of encoding
+        the whole chain for every request, along with the complete chain message of the latest tip
+
+        Attributes
+        ----------
+        hashes : list[str]
+            the hash of every encoded block, in order
+        offsets : list[int]
+            where the record of every encoded block starts in records
+        records : bytearray
+            the length prefixed encoded blocks, one after the other
+        tip : (int, str)
+            the length and the hash of the last block of the chain whose message is cached
+        message : bytes
+            the chain message of tip
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hashes = []
+        self.offsets = []
+        self.records = bytearray()
+        self.tip = None
+        self.message = None
+
+    def sync(self, blocks, length):
+        # keeps the encoded blocks which are common with blocks[:length] and encodes the rest (lock held).
+        # the hash of a block depends on the previous one, so equal hashes at a position mean equal prefixes
+        common = min(len(self.hashes), length)
+        while common and self.hashes[common - 1] != blocks[common - 1].hash:
+            common -= 1
+        if common < len(self.hashes):
+            del self.records[self.offsets[common]:]
+            del self.hashes[common:]
+            del self.offsets[common:]
+        for block in blocks[common:length]:
+            self.offsets.append(len(self.records))
+            self.hashes.append(block.hash)
+            self.records += block_record(block)
+
+    def chain(self, blocks, length):
+        # the chain message of blocks[:length], built once per tip
+        tip = (length, blocks[length - 1].hash if length else None)
+        with self.lock:
+            if self.tip != tip:
+                self.sync(blocks, length)
+                self.message = chain_message(CHAIN, length, self.records)
+                self.tip = tip
+            return self.message
+
+    def blocks(self, blocks, length, start):
+        # the blocks message of blocks[start:length]
+        with self.lock:
+            self.sync(blocks, length)
+            if start >= length:
+                return chain_message(BLOCKS, 0, b'')
+            return chain_message(BLOCKS, length - start, self.records[self.offsets[start]:])
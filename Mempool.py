@@ -0,0 +1,154 @@
+import time
+from collections import OrderedDict
+
+
+class Mempool:
+    """
+        The transactions collected by a node but not yet added to the blockchain, keyed by their id
+        in order of arrival
+
+        Attributes
+        ----------
+        size : int
+            the maximum number of pending transactions
+        entries : OrderedDict[str, (Transaction, list[dict], int, float, list)]
+            every pending transaction along with the outputs it spent, its position in order of arrival, the
+            time it arrived and its slot in log
+        spenders : dict[uuid.UUID, str]
+            the id of the pending transaction which spent every output
+        arrivals : int
+            the number of transactions added so far, the position in order of arrival of the next one
+        log : list[[Transaction, int]]
+            a slot for every transaction added since the last clear in order of arrival, holding the
+            transaction and the removal after which it stopped being pending (None while it is). Published
+            views share it, so it is only appended to, and replaced by a new list rather than compacted
+        removals : int
+            the number of transactions removed so far
+    """
+
+    def __init__(self, size=10000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.spenders = {}
+        self.arrivals = 0
+        self.log = []
+        self.removals = 0
+
+    def add(self, transaction, spent):
+        # spent are the outputs the transaction spent, needed to undo it
+        slot = [transaction, None]
+        self.log.append(slot)
+        self.entries[transaction.transaction_id] = (transaction, spent, self.arrivals, time.time(), slot)
+        self.arrivals += 1
+        for x in transaction.transaction_inputs:
+            self.spenders[x['id']] = transaction.transaction_id
+
+    def remove(self, transaction_id):
+        # returns (transaction, spent), or None if it wasn't pending
+        entry = self.entries.pop(transaction_id, None)
+        if entry is None:
+            return None
+        for x in entry[0].transaction_inputs:
+            if self.spenders.get(x['id']) == transaction_id:
+                del self.spenders[x['id']]
+        self.removals += 1
+        entry[4][1] = self.removals
+        if len(self.log) > 2 * len(self.entries) + 64:
+            self.log = [x[4] for x in self.entries.values()]
+        return entry[0], entry[1]
+
+    def get(self, transaction_id):
+        entry = self.entries.get(transaction_id)
+        return entry[0] if entry is not None else None
+
+    def arrival(self, transaction_id):
+        # the time the transaction arrived, or None if it isn't pending
+        entry = self.entries.get(transaction_id)
+        return entry[3] if entry is not None else None
+
+    def conflicts(self, transaction):
+        # ids of the pending transactions which spent an input of transaction
+        found = {self.spenders.get(x['id']) for x in transaction.transaction_inputs}
+        found.discard(None)
+        found.discard(transaction.transaction_id)
+        return found
+
+    def descendants(self, transaction_ids):
+        # the given pending transactions along with the ones spending their outputs, recursively,
+        # in order of arrival
+        found = set()
+        stack = list(transaction_ids)
+        while stack:
+            transaction_id = stack.pop()
+            if transaction_id in found or transaction_id not in self.entries:
+                continue
+            found.add(transaction_id)
+            for x in self.entries[transaction_id][0].transaction_outputs:
+                if x['id'] in self.spenders:
+                    stack.append(self.spenders[x['id']])
+        return sorted(found, key=lambda x: self.entries[x][2])
+
+    def ids(self):
+        return iter(self.entries)
+
+    def full(self):
+        return len(self.entries) >= self.size
+
+    def clear(self):
+        # empties the mempool and returns its (transaction, spent) entries in order of arrival
+        entries = [(t, spent) for t, spent, _, _, _ in self.entries.values()]
+        self.entries = OrderedDict()
+        self.spenders = {}
+        self.removals += 1
+        self.log = []
+        return entries
+
+    def view(self):
+        # the pending transactions as they are now, in O(1): they are read from the log when iterated
+        return PendingView(self.log, len(self.log), self.removals, len(self.entries))
+
+    def __contains__(self, transaction):
+        # the very same transaction, not just one with the same id
+        entry = self.entries.get(transaction.transaction_id)
+        return entry is not None and entry[0] == transaction
+
+    def __iter__(self):
+        return (x[0] for x in list(self.entries.values()))
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class PendingView:
+    """
+        The transactions which were pending when the view was taken, in order of arrival. Iterating it reads
+        the slots of the log up to where it ended then, skipping the ones removed by then, so it can be read
+        without the lock of the node while the mempool changes
+
+        Attributes
+        ----------
+        log : list[[Transaction, int]]
+            the log of the mempool when the view was taken
+        length : int
+            the length of the log then
+        removals : int
+            the number of removals then
+        count : int
+            the number of pending transactions then
+    """
+
+    __slots__ = ('log', 'length', 'removals', 'count')
+
+    def __init__(self, log, length, removals, count):
+        self.log = log
+        self.length = length
+        self.removals = removals
+        self.count = count
+
+    def __iter__(self):
+        for transaction, removed in self.log[:self.length]:
+            if removed is None or removed > self.removals:
+                yield transaction
+
+    def __len__(self):
+        return self.count
@@ -0,0 +1,249 @@
+import functools
+import math
+import threading
+import time
+
+# upper bounds (in seconds) of the buckets of a histogram, from a signature check to a block of a slow peer
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def number(value):
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """
+        A named family of values of the same kind, one for every combination of its labels, exported in the
+        Prometheus text format
+
+        Attributes
+        ----------
+        name : str
+            the name of the metric
+        documentation : str
+            what the metric measures
+        labelnames : tuple[str]
+            the names of the labels which tell the values of the family apart
+        children : dict[tuple, object]
+            the value of every combination of labels seen so far
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        # the value of the given combination of labels, created the first time it's needed
+        values = tuple(str(x) for x in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+        with self.lock:
+            child = self.children.get(values)
+            if child is None:
+                child = self.children[values] = self.child()
+        return child
+
+    def child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        # (suffix of the name, labels, value) of every sample
+        with self.lock:
+            children = list(self.children.items())
+        for values, child in children:
+            for suffix, extra, value in child.samples():
+                yield suffix, dict(zip(self.labelnames, values), **extra), value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {escape(self.documentation)}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self.samples():
+            text = ','.join(f'{k}="{escape(v)}"' for k, v in labels.items())
+            lines.append(f'{self.name}{suffix}{{{text}}} {number(value)}' if text else
+                         f'{self.name}{suffix} {number(value)}')
+        return '\n'.join(lines)
+
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def samples(self):
+        yield '', {}, self.value
+
+
+class Counter(Metric):
+    # a value which only goes up, e.g. the number of times something happened
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.labels()
+
+    def child(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    # a value read when the metrics are collected, from function
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self):
+        yield '', {}, self.function()
+
+
+class HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def samples(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, x in zip(self.buckets, counts):
+            cumulative += x
+            yield '_bucket', {'le': number(bound)}, cumulative
+        yield '_bucket', {'le': '+Inf'}, count
+        yield '_sum', {}, total
+        yield '_count', {}, count
+
+
+class Histogram(Metric):
+    # the distribution of observed values (durations in seconds) over BUCKETS
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.labels()
+
+    def child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class Registry:
+    """
+        The metrics of a node, rendered together for a scraper
+
+        Attributes
+        ----------
+        metrics : list[Metric]
+            the registered metrics in order of registration
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, function):
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        return '\n'.join(x.render() for x in self.metrics) + '\n'
+
+
+class TimedLock:
+    """
+        A lock which observes how long every acquisition waited for it and how long it was held
+
+        Attributes
+        ----------
+        wait : HistogramValue
+            the seconds spent waiting to acquire the lock
+        hold : HistogramValue
+            the seconds the lock was held
+    """
+
+    def __init__(self, wait, hold):
+        self.inner = threading.Lock()
+        self.wait = wait
+        self.hold = hold
+        self.acquired = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        if not self.inner.acquire(blocking, timeout):
+            return False
+        # only the holder writes acquired, until it releases the lock
+        self.acquired = time.perf_counter()
+        self.wait.observe(self.acquired - start)
+        return True
+
+    def release(self):
+        held = time.perf_counter() - self.acquired
+        self.inner.release()
+        self.hold.observe(held)
+
+    def locked(self):
+        return self.inner.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def timed(histogram, *labels):
+    # decorates a method, observing its duration in the histogram which is the attribute of its object named
+    # histogram
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                getattr(self, histogram).labels(*labels).observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
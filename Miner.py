@@ -0,0 +1,124 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import time
+
+# attempts a worker makes between two checks of the stop flag
+CHECK_INTERVAL = 1024
+# seconds between two checks of the block's validity, in case nobody stopped the workers
+WAIT_INTERVAL = 1
+
+
+def work(jobs, results, stop):
+    """Loop of a mining process: takes a job, searches its share of the nonce space and
+    reports back (worker, nonce or None, number of hashes, elapsed seconds).
+
+    Worker i of n tries nonces i, i + n, i + 2n, ... so the shares never overlap. Workers exit
+    as soon as they notice that the node's process is gone.
+    """
+    parent = os.getppid()
+    while True:
+        try:
+            job = jobs.get(timeout=1)
+        except queue.Empty:
+            if os.getppid() != parent:
+                return
+            continue
+        if job is None:
+            return
+        worker, prefix, target, start, step = job
+        midstate = hashlib.sha256(prefix)
+        nonce = start
+        found = None
+        begin = time.time()
+        while found is None and not stop.is_set() and os.getppid() == parent:
+            for _ in range(CHECK_INTERVAL):
+                attempt = midstate.copy()
+                attempt.update(str(nonce).encode())
+                if int.from_bytes(attempt.digest(), 'big') < target:
+                    found = nonce
+                    break
+                nonce += step
+        hashes = (nonce - start) // step + (found is not None)
+        results.put((worker, found, hashes, time.time() - begin))
+
+
+class Miner:
+    """
+        A pool of processes which split the nonce space of a block among them
+
+        Attributes
+        ----------
+        workers : int
+            the number of mining processes
+        hashrates : dict[int, float]
+            hashes per second achieved by each worker during the last job
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.hashrates = {}
+        self.processes = []
+        self.jobs = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+
+    def start(self):
+        # processes are started lazily, on the first job
+        for _ in range(self.workers):
+            process = multiprocessing.Process(target=work, name='miner',
+                                              args=(self.jobs, self.results, self.stop_event),
+                                              daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def mine(self, prefix, target, still_valid=lambda: True):
+        """Finds a nonce s.t. sha256(prefix + str(nonce)), read as a number, is below target. The sha256 state
+        after the prefix is computed once and copied for every attempt.
+
+        Parameters
+        ----------
+        prefix : bytes
+            The part of the block's header which precedes the nonce.
+        target : int
+            The bound of the hash, see Block.target.
+        still_valid : callable
+            Checked once the jobs are queued and then every WAIT_INTERVAL seconds, mining is abandoned as soon
+            as it returns False. Whoever invalidates the block is expected to call stop() right away.
+
+        Returns
+        -------
+        int
+            the found nonce or None in case mining was stopped.
+        """
+        if not self.processes:
+            self.start()
+        self.stop_event.clear()
+        for worker in range(self.workers):
+            self.jobs.put((worker, prefix, target, worker, self.workers))
+        # the block may have become stale before the stop flag was cleared
+        if not still_valid():
+            self.stop()
+        nonce = None
+        reported = 0
+        while reported < self.workers:
+            try:
+                worker, found, hashes, elapsed = self.results.get(timeout=WAIT_INTERVAL)
+            except queue.Empty:
+                if not still_valid():
+                    self.stop()
+                continue
+            reported += 1
+            self.hashrates[worker] = hashes / elapsed if elapsed else 0.0
+            if found is not None and nonce is None:
+                nonce = found
+                self.stop()
+        return nonce
+
+    def stop(self):
+        # workers notice within CHECK_INTERVAL hashes
+        self.stop_event.set()
+
+    def hashrate(self):
+        return sum(self.hashrates.values())
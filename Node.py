@@ -1,27 +1,47 @@
-import hashlib
-import secrets
 import time
 import os
 import flask
-import jsonpickle
 import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from flask import current_app
-from Crypto.Signature import pkcs1_15
-from Crypto.PublicKey import RSA
 from requests import RequestException
-from Block import Block
-from Wallet import Wallet
+from Block import Block, target
+from Wallet import Wallet, fingerprint, registration_hash
+from SignatureScheme import load_cipher
 from Transaction import Transaction
-from Crypto.Hash import SHA256
 from dotenv import load_dotenv
-from Blockchain import Blockchain
+from Blockchain import Blockchain, TARGET_BLOCK_INTERVAL, MAX_CLOCK_DRIFT
+from Miner import Miner
+from UTXOSet import UTXOSet
+from Mempool import Mempool
+from Snapshot import Snapshot
+from BlockStore import BlockStore
+from Verifier import Verifier
+from Peer import Peer
+from Metrics import Registry, TimedLock, timed
+from Wire import encode_ring, encode_transaction, encode_block, decode_blocks
 
 # retrieve from .env file
 load_dotenv()
 N = int(os.getenv("N"))
 CAPACITY = int(os.getenv("CAPACITY"))
-MINING_DIFFICULTY = int(os.getenv("MINING_DIFFICULTY"))
+MINING_WORKERS = int(os.getenv("MINING_WORKERS", os.cpu_count() or 1))
+KEY_CACHE_SIZE = int(os.getenv("KEY_CACHE_SIZE", 1024))
+SIGNATURE_CACHE_SIZE = int(os.getenv("SIGNATURE_CACHE_SIZE", 100000))
+PEER_QUEUE_SIZE = int(os.getenv("PEER_QUEUE_SIZE", 1000))
+PEER_RETRIES = int(os.getenv("PEER_RETRIES", 3))
+BATCH_WINDOW = float(os.getenv("BATCH_WINDOW", 0.005))
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 64))
+SYNC_TIMEOUT = float(os.getenv("SYNC_TIMEOUT", 5))
+MEMPOOL_SIZE = int(os.getenv("MEMPOOL_SIZE", 10000))
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT", 5))
+BLOCK_DEADLINE = float(os.getenv("BLOCK_DEADLINE", 0))
+VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", os.cpu_count() or 1))
+WALLET_KEY_FILE = os.getenv("WALLET_KEY_FILE")
+BLOCK_STORE = os.getenv("BLOCK_STORE")
+# blocks of a chain whose signatures are checked together before they are applied in order
+VERIFY_BATCH = 256
 
 
 class Node:
@@ -37,38 +57,98 @@ class Node:
             the IPv4 address of the node
         port : int
             the port on which the application NoobCash listens
-        NBCs : dict[Bytes, list[dict[]]]
-            a dict which contains the unspent transaction outputs for every node in the network
-            key = public_key and value = list of UTXOs (default {})
+        NBCs : UTXOSet
+            the unspent transaction outputs of the network keyed by their id, indexed by owner (address, the
+            fingerprint of the owner's public key) along with the balance of every owner
         wallet : Wallet
             the wallet of the node
         ring : list[(str, int, bytes)]
             a list which contains tuples of (ip, port, public_key) and index of list corresponds
             to id of each node in the network (default [])
-        transactions : list[Transaction]
-            a list which contains the transactions collected by the node but not yet added to the
-            blockchain (default [])
+        ring_index : dict[str, int]
+            the id of every node in the ring keyed by its address (default {})
+        registrations : dict[str, float]
+            the timestamp of the last registration of every node keyed by its address, a registration
+            must be newer (default {})
+        peers : dict[(str, int), Peer]
+            a long-lived sender for every other node in the network keyed by (ip, port) (default {})
+        transactions : Mempool
+            the transactions collected by the node but not yet added to the blockchain, keyed by their id
+            in order of arrival, along with the outputs each of them spent (at most MEMPOOL_SIZE)
         block : Block
             current block to be filled with collected transactions (default None)
+        sealed : Block
+            the last block handed to the miner, no transaction is added to it anymore (default None)
+        block_filled : threading.Event
+            set whenever a transaction is added to the current block, wakes up the sealer
+        sealer : threading.Thread
+            hands the current block to the miner once its oldest transaction has waited BLOCK_DEADLINE seconds,
+            started with the first transaction if BLOCK_DEADLINE is set (default None)
         chain : Blockchain
-            the blockchain of NoobCash network
+            the blockchain of NoobCash network, along with an index of its confirmed transaction ids
+        store : BlockStore
+            the chain on disk, synced by a thread of its own with the chain of the snapshot whenever a
+            published snapshot has another tip, once the node has a valid chain (default None, no store).
+            After a restart the bootstrap node takes its chain from it and the other nodes fetch only the
+            blocks after it
+        store_changed : threading.Event
+            set when the store is behind the chain of the snapshot
+        undo_log : list[list[(Transaction, list[dict])]]
+            for every block of the chain, its transactions along with the outputs each of them spent, so that
+            the block can be rolled back
         mining_flag : bool
             a flag that indicates whether node is currently mining or not (default False)
-        lock : threading.Lock
-            a lock used to ensure isolation between procedures which change same objects
+        lock : TimedLock
+            a lock used to ensure isolation between procedures which change same objects, observing how long it
+            is waited for and held
         mining_lock : threading.Lock
             a lock used to assure isolation of mining procedure
+        sync_lock : threading.Lock
+            a lock which ensures that only one resolution of conflicts runs at a time
+        miner : Miner
+            the pool of processes which search the nonce space of a block (MINING_WORKERS processes)
+        verifier : Verifier
+            checks signatures of transactions, caching parsed public keys and already verified signatures,
+            and spreads the signatures of a block or chain over VERIFY_WORKERS processes
+        chain_ready : threading.Event
+            set once the node has a validated chain and knows the ring, so it can process transactions
+        network_ready : threading.Event
+            set once every node of the network owns coins
+        snapshot : Snapshot
+            an immutable view of the chain, balances and pending transactions, replaced after every change so
+            that readers never wait for the lock
+        metrics : Registry
+            the counters, gauges and histograms of the node, exported on /metrics
+        validation_time : Histogram
+            seconds spent validating transactions, blocks and chains, by kind
+        mining_attempts : Counter
+            blocks the node finished mining, by outcome (won, or lost to a block of another node)
+        resolutions : Counter
+            runs of resolve_conflicts, by outcome (replaced the chain, kept it, or skipped since one was running)
+        delivery_time : Histogram
+            seconds from queueing a message for a peer until the peer answered, by peer
 
         Methods
         -------
-        create_wallet()
-            Returns the wallet of the node
+        create_wallet(key_file)
+            Returns the wallet of the node, with the keys of key_file if given
         register_node_to_ring(public_key, ip, port)
-            Registers node to the NoobCash network and returns its id and bootstrap's current blockchain
+            Registers node to the NoobCash network, or recognises a node which rejoins it, and returns its id,
+            bootstrap's current blockchain and the ring for a rejoining node
+        index_node(node_id, public_key)
+            Indexes the node of the ring with id node_id by its address and makes it an owner of NBCs
+        restore()
+            Takes the chain of the store as the chain of the bootstrap node after a restart
+        resume(peer)
+            Builds the chain of a restarted node out of its stored blocks and the blocks of peer after them
         update(node_id, chain)
             Sets node's id to node_id and its chain to given chain (provided by bootstrap node)
         set_ring(ring)
             Sets node's ring to given ring (provided by bootstrap node)
+        peer(ip, port)
+            Returns the sender of messages to the node listening on ip:port
+        broadcast(endpoint, con)
+            Queues a message to endpoint for every other node in the network
         broadcast_ring(app)
             Sends network ring to all nodes in the network (executed only by bootstrap node)
         broadcast_transaction(transaction)
@@ -79,11 +159,33 @@ class Node:
             Crafts new transaction with amount coins sent to receiver if node has enough coins
         validate_transaction(transaction)
             Checks validity of transactions based on signature, id, inputs, and outputs
+        verify_signatures(transactions)
+            Checks the signatures of many transactions in parallel ahead of their validation in order
         update_NBCs(transaction)
             Updates NBCs of sender and receiver, and if node is either of them, adjusts wallet's balance
+        check_network()
+            Sets network_ready once every node of the network owns coins
+        undo_NBCs(transaction, spent)
+            Reverts the changes of update_NBCs, given the outputs the transaction spent
         add_transaction_to_block(transaction, app=None)
             Adds a new transaction to current block if it's valid, and initiates mining in case of
             full block
+        add_batch_to_block(transactions, app=None)
+            Adds a batch of new transactions to current block under a single acquisition of the lock
+        seal_block(app)
+            Hands the current block to the miner, even if it isn't full
+        seal_on_deadline(app)
+            Seals the current block once its oldest transaction has waited BLOCK_DEADLINE seconds
+        accept_transaction(transaction)
+            Adds a new transaction to pending transactions and current block if it's valid
+        add_pending(transaction)
+            Applies a valid transaction to NBCs and adds it to pending transactions, evicting old ones if full
+        evict(keep)
+            Drops the oldest pending transaction which isn't in current block or keep, along with its descendants
+        drop_pending(transaction_ids)
+            Drops pending transactions and reverts their changes to NBCs
+        readmit(transactions)
+            Adds the still valid ones of transactions to pending transactions
         add_transactions_to_block()
             Adds pending transactions to current block in bulk
         create_new_block(block)
@@ -92,20 +194,37 @@ class Node:
         validate_block(block)
             Checks validity of block based on its hash, satisfaction of mining difficulty, hash of previous block
             in chain, and valid transactions within it.
+        check_block(block, previous, difficulty)
+            Checks validity of block's hash and satisfaction of its mining difficulty, and that it follows
+            previous with the expected difficulty
+        apply_block(block, validate=False)
+            Applies the transactions of block to NBCs, appends it to the chain and records its undo entry
+        rollback(length)
+            Removes the blocks after the first length ones and reverts their transactions using their undo entries
+        publish()
+            Replaces snapshot with a view of the current state
+        write_store()
+            Keeps the store in sync with the chain of snapshot, outside of the lock
+        tip_changed()
+            Interrupts mining of a block on top of the previous tip
         mine_block(block, app)
             Mines block and if it succeeds, broadcasts block, updates blockchain and processes pending transactions
         proof_of_work(block)
             Finds nonce s.t. hash of block satisfies mining difficulty
         validate_chain(chain)
             Checks validity of chain based on contained transactions within it, and updates NBCs of nodes
-        recalculate_NBCs(chain)
-            Replaces blockchain with chain and recalculates NBCs of nodes and pending transactions according to
-            included transactions
+        recalculate_NBCs(fork, blocks)
+            Rolls the chain back to fork and applies blocks after it, validating them, and recalculates NBCs of
+            nodes and pending transactions
+        request_length(peer)
+            Returns the length of the chain of a peer
+        request_blocks(peer)
+            Returns the position of the last common block with the chain of a peer and the blocks after it
         resolve_conflicts(app)
-            Finds chain of greatest length across the network and replaces node's chain with it
+            Finds chain of greatest length across the network and adopts the blocks after the common ancestor
         """
 
-    def __init__(self, node_id, ip, port):
+    def __init__(self, node_id, ip, port, key_file=WALLET_KEY_FILE, store=BLOCK_STORE):
         """
         Parameters
         ----------
@@ -115,34 +234,99 @@ class Node:
             The IPv4 address of the node
         port : int
             The port on which NoobCash application listens on
+        key_file : str
+            The file the keys of the wallet are loaded from, or saved to if it doesn't exist (default
+            WALLET_KEY_FILE, None for new keys on every start)
+        store : str
+            The segment file of the block store, the chain stored by an earlier run is resumed from and
+            trusted (default BLOCK_STORE, None for no store)
         """
         self.id = node_id
         self.ip = ip
         self.port = port
-        self.NBCs = {}  # key = public_key, value = [UTXOs]
-        self.wallet = self.create_wallet()
+        self.NBCs = UTXOSet()
+        self.wallet = self.create_wallet(key_file)
         self.ring = []  # (ip, port, public_key)
-        self.transactions = []
+        self.ring_index = {}  # address -> id
+        self.registrations = {}
+        self.peers = {}
+        self.peers_lock = threading.Lock()
+        self.transactions = Mempool(MEMPOOL_SIZE)
         self.block = None
+        self.sealed = None
+        self.block_filled = threading.Event()
+        self.sealer = None
         self.chain = Blockchain(self)
+        self.store = BlockStore(store) if store else None
+        self.store_changed = threading.Event()
+        self.undo_log = [[]]  # genesis is never rolled back
         self.mining_flag = False
-        self.lock = threading.Lock()
+        self.metrics = Registry()
+        self.lock = TimedLock(
+            self.metrics.histogram('noobcash_lock_wait_seconds', 'Time spent waiting for the lock of the node'),
+            self.metrics.histogram('noobcash_lock_hold_seconds', 'Time the lock of the node was held'))
         self.mining_lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.miner = Miner(MINING_WORKERS)
+        self.verifier = Verifier(KEY_CACHE_SIZE, SIGNATURE_CACHE_SIZE, VERIFY_WORKERS)
+        self.chain_ready = threading.Event()
+        self.network_ready = threading.Event()
+        self.validation_time = self.metrics.histogram('noobcash_validation_seconds',
+                                                      'Time spent validating a transaction, block or chain',
+                                                      ['kind'])
+        self.mining_attempts = self.metrics.counter('noobcash_mining_attempts_total',
+                                                    'Blocks the node finished mining by outcome', ['outcome'])
+        self.resolutions = self.metrics.counter('noobcash_resolve_conflicts_total',
+                                                'Runs of conflict resolution by outcome', ['outcome'])
+        self.delivery_time = self.metrics.histogram('noobcash_peer_delivery_seconds',
+                                                    'Time from queueing a message for a peer until it answered',
+                                                    ['peer'])
+        self.metrics.gauge('noobcash_hashrate', 'Hashes per second of the last mined block',
+                           self.miner.hashrate)
+        self.metrics.gauge('noobcash_mempool_transactions', 'Pending transactions',
+                           lambda: len(self.snapshot.transactions))
+        self.metrics.gauge('noobcash_unspent_outputs', 'Unspent transaction outputs', lambda: len(self.NBCs))
+        self.metrics.gauge('noobcash_chain_height', 'Blocks of the chain', lambda: self.snapshot.length)
+        self.metrics.gauge('noobcash_difficulty', 'Leading zero bits required of the hash of the next block',
+                           lambda: self.chain.next_difficulty() if self.chain else 0)
+        for outcome in ('won', 'lost'):
+            self.mining_attempts.labels(outcome)
+        for outcome in ('replaced', 'kept', 'skipped'):
+            self.resolutions.labels(outcome)
+        if self.chain:  # the bootstrap node starts with genesis and is the first node of the ring
+            self.restore()
+            self.ring.append((ip, port, self.wallet.public_key))
+            self.index_node(0, self.wallet.public_key)
+            self.chain_ready.set()
+        self.snapshot = None
+        self.publish()
+        if self.store is not None:
+            threading.Thread(target=self.write_store, name='store', daemon=True).start()
 
-    def create_wallet(self) -> Wallet:
+    def create_wallet(self, key_file: str = None) -> Wallet:
         """Creates the wallet of the node.
 
+        Parameters
+        ----------
+        key_file : str
+            The file the keys of the wallet are loaded from, or saved to if it doesn't exist.
+
         Returns
         ------
         Wallet
             the created wallet of the node.
         """
 
-        return Wallet()
+        return Wallet(key_file=key_file)
 
-    def register_node_to_ring(self, public_key: bytes, ip: str, port: int) -> (int, Blockchain):
+    def register_node_to_ring(self, public_key: bytes, ip: str, port: int, timestamp: float,
+                              signature: bytes) -> (int, Blockchain, list):
         """Appends new node to ring and broadcasts the updated ring to all nodes if all nodes
-        have joined (executed only by the bootstrap node).
+        have joined (executed only by the bootstrap node). A node whose public key is already in the ring
+        has restarted: it keeps its id (and so its coins) and is sent the ring along with the chain, while
+        the other nodes learn its new address if it changed. Public keys are known to every node, so a
+        registration must be signed with the private key, recently and later than the previous one of the
+        same key, or anyone could take the place of a node in the ring.
 
         Parameters
         ----------
@@ -152,25 +336,131 @@ class Node:
             The IPv4 address of the incoming node.
         port : int
             The port on which the NoobCash application of the incoming node listens.
+        timestamp : float
+            When the incoming node signed the registration.
+        signature : bytes
+            The incoming node's signature of registration_hash(public_key, ip, port, timestamp).
 
         Returns
         -------
         int
-            the incoming node's assigned id
+            the incoming node's assigned id, None if the registration wasn't valid
         Blockchain
             the bootstrap's current chain
+        list[(str, int, bytes)]
+            the ring, if the incoming node rejoins a complete ring, None otherwise
         """
 
+        address = fingerprint(public_key)
+        try:
+            load_cipher(public_key).verify(registration_hash(public_key, ip, port, timestamp), signature)
+        except (ValueError, TypeError, IndexError):
+            print('Registration not signed by the owner of the key')
+            return None, None, None
+        with self.lock:
+            if not abs(time.time() - timestamp) < MAX_CLOCK_DRIFT or timestamp <= self.registrations.get(address, 0):
+                print('Registration is stale')
+                return None, None, None
+            self.registrations[address] = timestamp
+            node_id = self.ring_index.get(address)
+            if node_id is not None:
+                print(f'Node {node_id} rejoins from {ip}:{port}')
+                moved = self.ring[node_id][:2] != (ip, port)
+                self.ring = list(self.ring)     # the previous list may be being broadcast
+                self.ring[node_id] = (ip, port, public_key)
+                ring = self.ring if len(self.ring) == N else None
+                if moved and ring is not None:
+                    message = encode_ring(ring)
+                    for i, x in enumerate(ring[1:], 1):
+                        if i != node_id:
+                            self.peer(x[0], x[1]).send('/setRing/', message)
+                return node_id, self.chain, ring
         node_id = len(self.ring)
         self.ring.append((ip, port, public_key))
-        self.NBCs[public_key] = []
+        self.index_node(node_id, public_key)
         if node_id == N - 1:
             app = current_app._get_current_object()
             thread = threading.Thread(target=self.broadcast_ring,
                                       name='broadcasting info and giving money',
                                       args=[app])
             thread.start()
-        return node_id, self.chain
+        return node_id, self.chain, None
+
+    def index_node(self, node_id: int, public_key: bytes) -> None:
+        """Indexes a node of the ring by its address and makes it a known owner of NBCs.
+
+        Parameters
+        ----------
+        node_id : int
+            The id of the node, its position in the ring.
+        public_key : bytes
+            The public_key of the node.
+        """
+        address = fingerprint(public_key)
+        self.ring_index[address] = node_id
+        self.NBCs.register(address)
+
+    def restore(self) -> bool:
+        """Replaces the new genesis of the bootstrap node with the chain of its store after a restart, if
+        the stored chain starts with a genesis paid to the node's wallet (i.e. the wallet's keys were kept
+        too). Stored blocks were validated before the restart, so only their hashes are checked.
+
+        Returns
+        -------
+        bool
+            whether the chain was restored from the store.
+        """
+        if self.store is None or not len(self.store):
+            return False
+        try:
+            blocks = list(self.store.read())
+        except ValueError as e:
+            print(f'Exception {e} occurred while reading {self.store.path}')
+            return False
+        if blocks[0].listOfTransactions[0]['receiver_address'] != self.wallet.address:
+            return False
+        self.NBCs = UTXOSet()
+        self.wallet.balance = 0
+        if not self.validate_chain(Blockchain.from_blocks(blocks)):
+            self.NBCs = UTXOSet()
+            self.wallet.balance = 0
+            self.chain = Blockchain(self)
+            self.undo_log = [[]]
+            return False
+        print(f'Restored {len(self.chain)} blocks from {self.store.path}')
+        self.block = Block(index=self.chain[-1].index + 1,
+                           previousHash=self.chain[-1].hash)
+        return True
+
+    def resume(self, peer: (str, int, bytes)) -> Blockchain:
+        """Builds the chain of a restarted node out of the blocks of its store and the blocks of peer (the
+        bootstrap node) after the last one they have in common, so that only the blocks added while the
+        node was away are downloaded. The stored blocks are validated along with the others once the node
+        gets the ring, checking only their hashes (see validate_chain).
+
+        Parameters
+        ----------
+        peer : (str, int, bytes)
+            The (ip, port, public_key) of the peer.
+
+        Returns
+        -------
+        Blockchain
+            the chain of peer.
+        """
+        try:
+            stored = list(self.store.read())
+        except ValueError as e:
+            print(f'Exception {e} occurred while reading {self.store.path}')
+            stored = []
+        with self.lock:
+            self.chain = Blockchain.from_blocks(stored)
+        fork, blocks = self.request_blocks(peer)
+        if fork < 0:    # the store belongs to another network, or couldn't be read
+            r = requests.get(f'http://{peer[0]}:{peer[1]}/getBlocks/0', timeout=SYNC_TIMEOUT)
+            return Blockchain.from_blocks(decode_blocks(r.content))
+        print(f'Resumed from {fork + 1} stored blocks, fetched {len(blocks)}')
+        return Blockchain.from_blocks(self.chain[:fork + 1] + blocks)
 
     def update(self, node_id: int, chain: Blockchain) -> None:
         """Sets id and chain to given node_id and chain by bootstrap node, respectively.
@@ -189,10 +479,12 @@ class Node:
             if self.chain:
                 self.block = Block(index=self.chain[-1].index + 1,
                                    previousHash=self.chain[-1].hash)
+            self.publish()
 
     def set_ring(self, ring: list[(str, int, bytes)]) -> None:
         """Replaces node's ring with the given ring by bootstrap node and expands
-        NBCs dictionary accordingly for all nodes in the ring.
+        NBCs accordingly for all nodes in the ring. A node which already has its chain only takes the
+        addresses of the ring, which change when a node rejoins from elsewhere.
 
         Parameters
         ----------
@@ -201,13 +493,60 @@ class Node:
         """
 
         with self.lock:
+            if self.chain_ready.is_set() and len(ring) == len(self.ring):
+                self.ring = ring
+                return
             self.ring = ring
-            for x in self.ring:
-                try:
-                    self.NBCs[x[2]]
-                except KeyError:
-                    self.NBCs[x[2]] = []
+            self.ring_index = {}
+            for i, x in enumerate(self.ring):
+                self.index_node(i, x[2])
             self.chain = self.chain if self.validate_chain(self.chain) else []
+            if self.chain:
+                self.chain_ready.set()
+            self.check_network()
+            self.publish()
+
+    def peer(self, ip: str, port: int) -> Peer:
+        """Returns the sender of messages to the node listening on ip:port, starting it the first
+        time it's needed.
+
+        Parameters
+        ----------
+        ip : str
+            The IPv4 address of the other node.
+        port : int
+            The port on which the NoobCash application of the other node listens.
+
+        Returns
+        -------
+        Peer
+            the long-lived sender to the other node.
+        """
+
+        with self.peers_lock:
+            if (ip, port) not in self.peers:
+                # a node which hasn't joined yet holds a message for up to READY_TIMEOUT before it answers
+                self.peers[(ip, port)] = Peer(ip, port, PEER_QUEUE_SIZE, PEER_RETRIES,
+                                              timeout=max(10.0, 2 * READY_TIMEOUT),
+                                              batch_window=BATCH_WINDOW, batch_size=BATCH_SIZE,
+                                              delivery_time=self.delivery_time.labels(f'{ip}:{port}'))
+            return self.peers[(ip, port)]
+
+    def broadcast(self, endpoint: str, con: bytes) -> None:
+        """Queues a message for every other node in the network, without waiting for it to be sent.
+
+        Parameters
+        ----------
+        endpoint : str
+            The endpoint of the other nodes which receives the message.
+        con : bytes
+            The encoded message.
+        """
+
+        for x in self.ring:
+            if x[2] == self.wallet.public_key:
+                continue
+            self.peer(x[0], x[1]).send(endpoint, con)
 
     def broadcast_ring(self, app: flask.app.Flask) -> None:
         """Broadcasts the network ring to all other nodes in the network (executed only
@@ -220,17 +559,16 @@ class Node:
         """
 
         with app.app_context():
-            con = jsonpickle.encode(self.ring)
-            for x in self.ring[1:]:
-                addr = f'http://{x[0]}:{x[1]}/setRing/'
-                try:
-                    threading.Thread(target=requests.post,
-                                     kwargs={'url': addr, 'json': con}, ).start()
-                except RequestException as e:
-                    print(f'Exception {e} occurred while '
-                          f'broadcasting ring to node {x[0]}:{x[1]}')
+            # each peer gets the ring before any transaction, since its queue is FIFO
+            self.broadcast('/setRing/', encode_ring(self.ring))
+            # a restored chain already pays the nodes which joined before the restart
+            with self.lock:
+                paid = {t.receiver_address for block in self.chain[1:] for t in block.listOfTransactions
+                        if t.sender_address == self.wallet.address}
+                paid.update(t.receiver_address for t in self.transactions if t.sender_address == self.wallet.address)
             for x in self.ring[1:]:
-                self.create_transaction(x[2], 100)
+                if fingerprint(x[2]) not in paid:
+                    self.create_transaction(fingerprint(x[2]), 100)
 
     def broadcast_transaction(self, transaction: Transaction) -> None:
         """Broadcasts a new transaction to all other nodes in the network.
@@ -241,17 +579,7 @@ class Node:
             The newly crafted transaction to be broadcast to the network.
         """
 
-        con = jsonpickle.encode(transaction)
-        for x in self.ring:
-            if x[2] == self.ring[self.id][2]:
-                continue
-            addr = f'http://{x[0]}:{x[1]}/addTransaction/'
-            try:
-                threading.Thread(target=requests.post,
-                                 kwargs={'url': addr, 'json': con}, ).start()
-            except RequestException as e:
-                print(f'Exception {e} occurred while broadcasting transaction '
-                      f'to node {x[0]}:{x[1]}')
+        self.broadcast('/addTransaction/', encode_transaction(transaction))
 
     def broadcast_block(self, block: Block) -> None:
         """Broadcasts a mined block to all other nodes in the network.
@@ -261,18 +589,7 @@ class Node:
         block : Block
             The newly mined block to be broadcast to the network.
         """
-        con = jsonpickle.encode(block)
-        for x in self.ring:
-            if x[2] == self.ring[self.id][2]:
-                continue
-            addr = f'http://{x[0]}:{x[1]}/addBlock/'
-            try:
-                threading.Thread(target=requests.post,
-                                 kwargs={'url': addr, 'json': con},
-                                 ).start()
-            except RequestException as e:
-                print(f'Exception {e} occurred while broadcasting '
-                      f'block to node {x[0]}:{x[1]}')
+        self.broadcast('/addBlock/', encode_block(block))
 
     def create_transaction(self, receiver: bytes, amount: int) -> bool:
         """Crafts a new transaction from the current node to receiver with amount coins
@@ -280,8 +597,8 @@ class Node:
 
         Parameters
         ----------
-        receiver : bytes
-            The public_key of the receiver of the coins.
+        receiver : str
+            The address of the receiver of the coins.
         amount : int
             The amount of coins to be transferred.
 
@@ -294,20 +611,21 @@ class Node:
         with self.lock:
             count = 0
             trans_in = []
-            for x in self.NBCs[self.wallet.public_key]:
+            for x in self.NBCs.unspent(self.wallet.address):
                 count += x['amount']
                 trans_in.append(x)
                 if count >= amount:
                     break
-            if count < amount or receiver not in set(self.NBCs.keys()):
+            if count < amount or not self.NBCs.has_owner(receiver):
                 return False
-            trans = Transaction(self.wallet.public_key,
-                                self.wallet.private_key,
+            trans = Transaction(self.wallet.address,
+                                self.wallet.signer,
                                 receiver, amount, trans_in)
         self.broadcast_transaction(trans)
         self.add_transaction_to_block(trans)
         return True
 
+    @timed('validation_time', 'transaction')
     def validate_transaction(self, transaction: Transaction) -> bool:
         """Checks validity of a transactions based on validity of its signature, not duplicate id
         validity of inputs (not double spent), and correct outputs according to transferred amount and
@@ -322,47 +640,66 @@ class Node:
         -------
         bool
             whether the transaction was valid or not. It wouldn't be valid in each of the following cases:
-            - Invalid signature (transaction_id doesn't equal decrypted signature based on public key of sender)
+            - Invalid signature (transaction_id doesn't equal decrypted signature based on public key of sender
+            or the hash of the transaction's contents), or a sender outside the ring
             - Duplicate id, i.e. transaction was received in the past
             - Invalid inputs (sender has already spent or never had the inputs to conclude the transaction)
             - Invalid outputs (output to receiver doesn't equal transferred amount or output to sender doesn't
-            equal the change)
-        """
-        public_key = RSA.importKey(transaction.sender_address)
-        cipher = pkcs1_15.new(public_key)  # binary form
-        trans_id = SHA256.new((transaction.sender_address.decode('utf-8') +
-                               transaction.receiver_address.decode('utf-8') +
-                               str(transaction.amount) +
-                               str(transaction.timestamp))
-                              .encode())
-        try:
-            cipher.verify(trans_id, transaction.signature)
-        except ValueError:
+            equal the change, or their ids aren't new or don't name the transaction)
+        """
+        sender_id = self.ring_index.get(transaction.sender_address)
+        if sender_id is None or not self.verifier.verify(transaction, self.ring[sender_id][2]):
             print('Transaction not validated because of a wrong signature')
             return False
-        for x in self.chain[1:]:
-            for t in x.listOfTransactions:
-                if transaction.transaction_id == t.transaction_id:
-                    print('Transaction not validated because it is a duplicate')
-                    return False
+        if self.chain.contains_transaction(transaction.transaction_id):
+            print('Transaction not validated because it is a duplicate')
+            return False
         count = 0
         trans_in = transaction.transaction_inputs
         trans_out = transaction.transaction_outputs
         sender = transaction.sender_address
+        if len(set(x['id'] for x in trans_in)) != len(trans_in):
+            print('Transaction not validated because it spends an input twice')
+            return False
         for x in trans_in:
-            if x not in self.NBCs[sender]:
+            if x['receiver'] != sender or self.NBCs.get(x['id']) != x:
                 print('Not enough NBCs to implement transaction')
                 return False
             else:
                 count += x['amount']
-        # check outputs
-        if transaction.amount != trans_out[-1]['amount']:
+        # check outputs, they must add up to the inputs exactly
+        if transaction.amount < 0 or count < transaction.amount or len(trans_out) not in (1, 2):
+            print('Not enough NBCs to implement transaction')
             return False
-        elif len(trans_out) != 1 and (count - transaction.amount) != trans_out[0]['amount']:
+        if transaction.amount != trans_out[-1]['amount'] or trans_out[-1]['receiver'] != transaction.receiver_address:
+            return False
+        elif len(trans_out) == 1 and count != transaction.amount:
+            return False
+        elif len(trans_out) != 1 and ((count - transaction.amount) != trans_out[0]['amount'] or
+                                      trans_out[0]['receiver'] != sender):
+            return False
+        if len(set(x['id'] for x in trans_out)) != len(trans_out) or \
+                any(x['id'] in self.NBCs or x['trans_id'] != transaction.transaction_id for x in trans_out):
+            print('Transaction not validated because of invalid output ids')
             return False
         return True
 
-    def update_NBCs(self, transaction: Transaction) -> None:
+    def verify_signatures(self, transactions: list[Transaction]) -> None:
+        """Checks the signatures of many transactions at once, in parallel, so that validating them in order
+        afterwards (which depends on the ones before) doesn't wait for a signature check each time.
+
+        Parameters
+        ----------
+        transactions : list[Transaction]
+            The transactions about to be validated.
+        """
+        keys = []
+        for t in transactions:
+            sender_id = self.ring_index.get(t.sender_address)
+            keys.append(self.ring[sender_id][2] if sender_id is not None else None)
+        self.verifier.verify_many(transactions, keys)
+
+    def update_NBCs(self, transaction: Transaction) -> list[dict]:
         """Based on the transactions modifies the NBCs of the sender and receiver, and in case
         the current node is either of them, updates its wallet's balance.
 
@@ -370,21 +707,52 @@ class Node:
         ----------
         transaction : Transaction
             The transaction whose outputs are to be processed.
+
+        Returns
+        -------
+        list[dict]
+            the outputs spent by the transaction, needed to undo it.
         """
         sender = transaction.sender_address
         receiver = transaction.receiver_address
         t_out = transaction.transaction_outputs
         t_in = transaction.transaction_inputs
-        if len(t_out) != 1:
-            self.NBCs[sender].append(t_out[0])
-        set_out = set([x['id'] for x in t_in])
-        self.NBCs[sender] = list(filter(lambda x: x['id'] not in set_out,
-                                        self.NBCs[sender]))
-        self.NBCs[receiver].append(t_out[- 1])
-        if sender == self.wallet.public_key:
+        spent = [x for x in (self.NBCs.spend(y['id']) for y in t_in) if x is not None]
+        for x in t_out:
+            self.NBCs.add(x)
+        if sender == self.wallet.address:
             self.wallet.balance -= transaction.amount
-        if receiver == self.wallet.public_key:
+        if receiver == self.wallet.address:
             self.wallet.balance += transaction.amount
+        self.check_network()
+        return spent
+
+    def check_network(self) -> None:
+        """Sets network_ready once every node of the network (N in number) owns coins.
+        """
+        if not self.network_ready.is_set() and len(self.ring) == N and \
+                all(self.NBCs.balance(x) != 0 for x in self.ring_index):
+            self.network_ready.set()
+
+    def undo_NBCs(self, transaction: Transaction, spent: list[dict]) -> None:
+        """Reverts update_NBCs for a transaction: removes its outputs, restores the outputs it spent and
+        adjusts wallet's balance back.
+
+        Parameters
+        ----------
+        transaction : Transaction
+            The transaction to be undone, it must be the last applied one still in effect.
+        spent : list[dict]
+            The outputs the transaction spent, as returned by update_NBCs.
+        """
+        for x in transaction.transaction_outputs:
+            self.NBCs.spend(x['id'])
+        for x in spent:
+            self.NBCs.add(x)
+        if transaction.sender_address == self.wallet.address:
+            self.wallet.balance += transaction.amount
+        if transaction.receiver_address == self.wallet.address:
+            self.wallet.balance -= transaction.amount
 
     def add_transaction_to_block(self, transaction: Transaction, app: flask.app.Flask = None) -> bool:
         """Adds a transactions to the current block if it's valid, and in case of a full block, initiates
@@ -402,26 +770,187 @@ class Node:
         bool
             whether the transaction was added to the block. It wouldn't be in case it was invalid.
         """
+        return self.add_batch_to_block([transaction], app)[0]
+
+    def add_batch_to_block(self, transactions: list[Transaction], app: flask.app.Flask = None) -> list[bool]:
+        """Adds a batch of transactions to the current block in one pass, acquiring the lock once, and in
+        case of a full block, initiates mining. If BLOCK_DEADLINE is set, the first call starts the sealer.
+
+        Parameters
+        ----------
+        transactions : list[Transaction]
+            The candidate transactions to be added to the current block, in order.
+        app: flask.app.Flask
+            The Flask environment in order to be able to create http requests.
+
+        Returns
+        -------
+        list[bool]
+            whether each transaction was added to the block. It wouldn't be in case it was invalid.
+        """
         if not app:
             app = current_app._get_current_object()
         with app.app_context():
             with self.lock:
-                curr_block_size = len(self.block.listOfTransactions)
-                if self.validate_transaction(transaction):
-                    self.transactions.append(transaction)
-                    self.update_NBCs(transaction)
-                    if curr_block_size != CAPACITY:
-                        self.block.add_transaction(transaction)
-                elif transaction in self.transactions and transaction not in self.block.listOfTransactions and \
-                        curr_block_size != CAPACITY:
-                    self.block.add_transaction(transaction)
-                else:
-                    return False
-                print('Transaction added in current block')
-            if len(self.block.listOfTransactions) == CAPACITY and not self.mining_flag:
-                thread = threading.Thread(target=self.mine_block, name='mining', args=[self.block, app])
-                thread.start()
-            return True
+                added = [self.accept_transaction(t) for t in transactions]
+                if len(self.block.listOfTransactions) == CAPACITY:
+                    self.seal_block(app)
+                if BLOCK_DEADLINE and self.sealer is None:
+                    self.sealer = threading.Thread(target=self.seal_on_deadline, name='sealing', args=[app],
+                                                   daemon=True)
+                    self.sealer.start()
+                self.publish()
+            return added
+
+    def seal_block(self, app: flask.app.Flask) -> None:
+        """Hands the current block to the miner (lock must be held), from then on transactions are only
+        collected as pending until the next block. Each block is handed over once.
+
+        Parameters
+        ----------
+        app: flask.app.Flask
+            The Flask environment in order to be able to create http requests.
+        """
+        if self.block is self.sealed or not self.block.listOfTransactions:
+            return
+        self.sealed = self.block
+        threading.Thread(target=self.mine_block, name='mining', args=[self.block, app]).start()
+
+    def seal_on_deadline(self, app: flask.app.Flask) -> None:
+        """Seals the current block once its oldest transaction has waited BLOCK_DEADLINE seconds, whether it
+        is full or not, so that no transaction waits for a full block for long. Runs in its own thread and
+        sleeps while the current block is empty or already sealed.
+
+        Parameters
+        ----------
+        app: flask.app.Flask
+            The Flask environment in order to be able to create http requests.
+        """
+        while True:
+            self.block_filled.wait()
+            with self.lock:
+                block = self.block
+                if block is None or block is self.sealed or not block.listOfTransactions:
+                    # whoever adds a transaction to the current block sets the event while holding the lock
+                    self.block_filled.clear()
+                    continue
+                arrived = self.transactions.arrival(block.listOfTransactions[0].transaction_id) or time.time()
+                delay = arrived + BLOCK_DEADLINE - time.time()
+                if delay <= 0:
+                    print(f'Sealing block with {len(block.listOfTransactions)} transactions after the deadline')
+                    self.seal_block(app)
+                    continue
+            time.sleep(delay)
+
+    def accept_transaction(self, transaction: Transaction) -> bool:
+        """Adds a transaction to the pending ones and to the current block if it's valid (lock must be held).
+
+        Parameters
+        ----------
+        transaction : Transaction
+            The candidate transaction to be added to the current block.
+
+        Returns
+        -------
+        bool
+            whether the transaction was added to the block. It wouldn't be in case it was invalid.
+        """
+        # a block handed to the miner is as good as full
+        curr_block_size = CAPACITY if self.block is self.sealed else len(self.block.listOfTransactions)
+        if self.validate_transaction(transaction):
+            if not self.add_pending(transaction):
+                return False
+            if curr_block_size != CAPACITY:
+                self.block.add_transaction(transaction)
+                self.block_filled.set()
+        elif transaction in self.transactions and transaction not in self.block.listOfTransactions and \
+                curr_block_size != CAPACITY:
+            self.block.add_transaction(transaction)
+            self.block_filled.set()
+        else:
+            return False
+        print('Transaction added in current block')
+        return True
+
+    def add_pending(self, transaction: Transaction) -> bool:
+        """Applies a valid transaction to NBCs and adds it to the pending ones. If there are already
+        MEMPOOL_SIZE pending transactions, the oldest ones are evicted to make room.
+
+        Parameters
+        ----------
+        transaction : Transaction
+            The validated transaction.
+
+        Returns
+        -------
+        bool
+            whether the transaction was added. It wouldn't be in case nothing could be evicted.
+        """
+        if self.transactions.full() and not self.evict({x['trans_id'] for x in transaction.transaction_inputs}):
+            print('Too many pending transactions, transaction rejected')
+            return False
+        self.transactions.add(transaction, self.update_NBCs(transaction))
+        return True
+
+    def evict(self, keep: set[str] = frozenset()) -> bool:
+        """Drops the oldest pending transaction which isn't in the current block, along with the pending
+        transactions spending its outputs, as long as none of them is in the current block or in keep.
+
+        Parameters
+        ----------
+        keep : set[str]
+            The ids of pending transactions which must not be dropped, e.g. the ones whose outputs an
+            incoming transaction spends.
+
+        Returns
+        -------
+        bool
+            whether any transaction was dropped.
+        """
+        keep = keep | {t.transaction_id for t in self.block.listOfTransactions}
+        for transaction_id in self.transactions.ids():
+            if transaction_id in keep:
+                continue
+            evicted = self.transactions.descendants([transaction_id])
+            if keep.isdisjoint(evicted):
+                self.drop_pending(evicted)
+                print(f'Evicted {len(evicted)} pending transactions')
+                return True
+        return False
+
+    def drop_pending(self, transaction_ids: list[str]) -> list[Transaction]:
+        """Removes pending transactions and reverts their changes to NBCs, the newest first.
+
+        Parameters
+        ----------
+        transaction_ids : list[str]
+            The ids of the transactions in order of arrival, including every pending transaction spending
+            their outputs.
+
+        Returns
+        -------
+        list[Transaction]
+            the dropped transactions in order of arrival.
+        """
+        dropped = []
+        for transaction_id in reversed(transaction_ids):
+            transaction, spent = self.transactions.remove(transaction_id)
+            self.undo_NBCs(transaction, spent)
+            dropped.append(transaction)
+        dropped.reverse()
+        return dropped
+
+    def readmit(self, transactions: list[Transaction]) -> None:
+        """Adds the transactions which are still valid to the pending ones, in order.
+
+        Parameters
+        ----------
+        transactions : list[Transaction]
+            The candidate transactions.
+        """
+        for transaction in transactions:
+            if self.validate_transaction(transaction):
+                self.add_pending(transaction)
 
     def add_transactions_to_block(self) -> None:
         """Adds a bunch of pending transactions to the (newly created) current block.
@@ -430,6 +959,7 @@ class Node:
             curr_block_size = len(self.block.listOfTransactions)
             if curr_block_size != CAPACITY - 1:
                 self.block.add_transaction(t)
+                self.block_filled.set()
             elif curr_block_size == CAPACITY - 1:
                 app = current_app._get_current_object()
                 threading.Thread(target=self.add_transaction_to_block,
@@ -452,23 +982,28 @@ class Node:
             whether the block was added to the chain. It wouldn't be in case it was invalid.
         """
         with self.lock:
-            if self.validate_block(block):
-                self.chain.add_block(block)
+            # the block wins over pending transactions which spent the same outputs as its transactions
+            conflicts = set()
+            for t in block.listOfTransactions:
+                if t not in self.transactions:
+                    conflicts |= self.transactions.conflicts(t)
+            dropped = self.drop_pending(self.transactions.descendants(conflicts)) if conflicts else []
+            if self.validate_block(block) and self.apply_block(block, validate=True):
                 print('New block added to chain')
-                block_transactions = block.listOfTransactions
-                for t in block_transactions:
-                    if t not in self.transactions:
-                        self.update_NBCs(t)
-                self.transactions = [x for x in self.transactions if x not in block_transactions]
                 self.block = Block(index=self.chain[-1].index + 1,
                                    previousHash=self.chain[-1].hash)
                 self.add_transactions_to_block()
+                self.publish()
                 return True
+            self.readmit(dropped)
+            self.publish()
             return False
 
+    @timed('validation_time', 'block')
     def validate_block(self, block: Block) -> bool:
         """Checks validity of block based on its hash, satisfaction of mining difficulty, hash of previous block
-        in chain, and valid transactions within it. In case of inconsistent hash of previous block, calls for resolution
+        in chain, and the signatures of the transactions within it, which are validated in order when the block
+        is applied (see apply_block). In case of inconsistent hash of previous block, calls for resolution
         of conflict.
 
         Parameters
@@ -480,31 +1015,158 @@ class Node:
         -------
         bool
             whether the block was valid or not. It wouldn't be valid in each of the following cases:
-            - Invalid hash (hash doesn't occur from block's attributes)
-            - Unsatisfactory hash (hash doesn't start with MINING_DIFFICULTY in number zeros)
+            - Invalid hash (hash doesn't occur from block's header and the merkle root of its transactions)
+            - Unsatisfactory hash (hash isn't below the target of the block's difficulty)
             - Inconsistent previous hash (previous hash doesn't belong to previous block in the chain)
-            - Invalid transactions within it
+            - Unexpected difficulty or timestamp (see check_block)
         """
-        s = (str(block.index) + str(block.previousHash) + str(block.timestamp) +
-             str(block.listOfTransactions) + str(block.nonce)).encode()
-        computed_hash = hashlib.sha256(s).hexdigest()
-        if computed_hash != block.hash:
-            print('Invalid block hash')
-            return False
-        if not (block.hash.startswith('0' * MINING_DIFFICULTY)):
-            print('Mining difficulty not reached')
+        if not self.check_block(block):
             return False
         if block.previousHash != self.chain[-1].hash:
             print('Different previous hashes, must resolve conflicts')
             app = current_app._get_current_object()
             threading.Thread(target=self.resolve_conflicts, args=[app]).start()
             return False
+        if not self.check_block(block, self.chain[-1], self.chain.next_difficulty()):
+            return False
+        self.verify_signatures([t for t in block.listOfTransactions if t not in self.transactions])
+        return True
+
+    def check_block(self, block: Block, previous: Block = None, difficulty: float = None) -> bool:
+        """Checks validity of block's hash, satisfaction of its mining difficulty and, if previous is given,
+        that block follows previous with the given difficulty. While the difficulty is retargeted, the
+        timestamp of block must also be after the one of previous and not too far in the future, since
+        timestamps decide the difficulty of later blocks.
+
+        Parameters
+        ----------
+        block : Block
+            The block to be checked for validity.
+        previous : Block
+            The block which should precede block in the chain, the tip of the chain.
+        difficulty : float
+            The difficulty block should have, the one which follows previous.
+
+        Returns
+        -------
+        bool
+            whether the block was valid or not.
+        """
+        computed_hash = block.myHash()
+        if computed_hash != block.hash:
+            print('Invalid block hash')
+            return False
+        if not block.mined():
+            print('Mining difficulty not reached')
+            return False
+        if previous is None:
+            return True
+        if block.previousHash != previous.hash or block.index != previous.index + 1:
+            print('Block does not follow previous block')
+            return False
+        if block.difficulty != difficulty:
+            print('Unexpected mining difficulty')
+            return False
+        if TARGET_BLOCK_INTERVAL and not previous.timestamp < block.timestamp < time.time() + MAX_CLOCK_DRIFT:
+            print('Block timestamp out of range')
+            return False
+        return True
+
+    def apply_block(self, block: Block, validate: bool = False) -> bool:
+        """Applies the transactions of the block to NBCs in order, appends the block to the chain and records
+        what its transactions spent in the undo log. Pending transactions are already applied, their undo
+        entries are moved from the mempool to the block once the whole block is applied.
+
+        Parameters
+        ----------
+        block : Block
+            The block to be appended to the chain.
+        validate : bool
+            Whether transactions are validated in order first: those which aren't pending against NBCs as the
+            transactions before them left it, and none may repeat an id of the block or spend an output of a
+            pending transaction which isn't before it in the block.
+
+        Returns
+        -------
+        bool
+            whether the block was appended or not. It wouldn't be in case of an invalid transaction, and then
+            NBCs are left as they were.
+        """
+        records = []
+        seen = set()
         for t in block.listOfTransactions:
-            if (t not in self.transactions) and not self.validate_transaction(t):
+            pending = t in self.transactions
+            if validate and (t.transaction_id in seen or
+                             any(x.trans_id not in seen and self.transactions.get(x.trans_id) is not None
+                                 for x in t.transaction_inputs) or
+                             not pending and not self.validate_transaction(t)):
                 print('Invalid transaction contained in block')
+                for x, spent in reversed(records):
+                    if spent is not None:
+                        self.undo_NBCs(x, spent)
                 return False
+            records.append((t, None if pending else self.update_NBCs(t)))
+            seen.add(t.transaction_id)
+        records = [self.transactions.remove(t.transaction_id) if spent is None else (t, spent) for t, spent in records]
+        self.chain.add_block(block)
+        self.undo_log.append(records)
+        self.tip_changed()
         return True
 
+    def rollback(self, length: int) -> list[Block]:
+        """Removes the blocks of the chain after the first length ones, reverting their transactions in
+        reverse order, and truncates the chain once.
+
+        Parameters
+        ----------
+        length : int
+            The number of blocks kept.
+
+        Returns
+        -------
+        list[Block]
+            the removed blocks, in the order they had in the chain.
+        """
+        if len(self.chain) <= length:
+            return []
+        for _ in range(len(self.chain) - length):
+            for t, spent in reversed(self.undo_log.pop()):
+                self.undo_NBCs(t, spent)
+        removed = self.chain.truncate(length)
+        self.tip_changed()
+        return removed
+
+    def publish(self) -> None:
+        """Replaces the snapshot with an immutable view of the current state (lock must be held) in
+        constant time. Blocks are shared with the chain, balances are copied by the next change to them and
+        pending transactions are read from the log of the mempool when iterated.
+        """
+        chain = self.chain
+        previous = self.snapshot
+        self.snapshot = Snapshot(blocks=chain.chain if chain else [],
+                                 length=len(chain),
+                                 heights=chain.heights if chain else {},
+                                 balances=self.NBCs.view(),
+                                 wallet_balance=self.wallet.balance,
+                                 transactions=self.transactions.view())
+        if self.store is not None and self.chain_ready.is_set() and \
+                (previous is None or previous.tip() is not self.snapshot.tip()):
+            self.store_changed.set()
+
+    def write_store(self) -> None:
+        """Syncs the store with the chain of the latest snapshot whenever it's behind, without the lock of
+        the node, since the blocks of a snapshot are never modified.
+        """
+        while True:
+            self.store_changed.wait()
+            self.store_changed.clear()
+            snapshot = self.snapshot
+            self.store.sync(snapshot.blocks, snapshot.length)
+
+    def tip_changed(self) -> None:
+        """Stops the miner, since a block being mined follows the previous tip."""
+        self.miner.stop()
+
     def mine_block(self, block: Block, app: flask.app.Flask) -> None:
         """Mines the block and if it succeeds, broadcasts the block,
         updates blockchain and processes pending transactions.
@@ -517,34 +1179,38 @@ class Node:
             The Flask environment in order to be able to create http requests.
         """
         with self.mining_lock:
-            if str(block.myHash()).startswith('0' * MINING_DIFFICULTY):
+            if block.mined():
                 return
             print('Proof of work begins')
             with app.app_context():
                 self.mining_flag = True
                 mined = self.proof_of_work(block)
+                print(f'Hashrate {self.miner.hashrate():.0f} H/s (' +
+                      ', '.join(f'{rate:.0f}' for rate in self.miner.hashrates.values()) + ' per worker)')
                 if mined:
                     print('Proof of work completed')
                     with self.lock:
-                        if self.chain[-1].index + 1 == mined.index:
+                        if self.chain[-1].hash == mined.previousHash:
                             print('I am the winner!')
-                            self.chain.add_block(mined)
+                            self.mining_attempts.labels('won').inc()
+                            self.apply_block(mined)
                             self.broadcast_block(mined)
-                            block_transactions = mined.listOfTransactions
-                            self.transactions = [x for x in self.transactions if x not in block_transactions]
                             self.block = Block(index=self.chain[-1].index + 1,
                                                previousHash=self.chain[-1].hash)
                             self.add_transactions_to_block()
+                            self.publish()
                         else:
                             print('Was very close to winning')
+                            self.mining_attempts.labels('lost').inc()
                 else:
                     print('Lost!')
+                    self.mining_attempts.labels('lost').inc()
                 self.mining_flag = False
 
     def proof_of_work(self, block: Block) -> Block:
-        """Tries random values of block's nonce until block's hash starts with MINING_DIFFICULTY in number
-        zeros. If anytime index of last block in the chain is different from block's index, someone found
-        a new block and mining was unsuccessful.
+        """Splits the nonce space of the block across the miner's processes until block's hash is below the
+        target of the difficulty which follows the tip of the chain. If the tip of the chain changes meanwhile,
+        the miner is stopped (see tip_changed) and mining was unsuccessful.
 
         Parameters
         ----------
@@ -556,20 +1222,21 @@ class Node:
         Block
             The mined block in case mining was successful or None in case mining was interrupted.
         """
-        block.nonce = secrets.token_bytes(4)
         block.timestamp = time.time()
-        while self.chain[-1].index + 1 == block.index:
-            if not str(block.myHash()).startswith('0' * MINING_DIFFICULTY):
-                block.nonce = secrets.token_bytes(4)
-                block.timestamp = time.time()
-            else:
-                block.hash = block.myHash()
-                return block
-        return None
+        block.difficulty = self.chain.next_difficulty()
+        nonce = self.miner.mine(block.header(), target(block.difficulty),
+                                lambda: self.chain[-1].hash == block.previousHash)
+        if nonce is None:
+            return None
+        block.nonce = nonce
+        block.hash = block.myHash()
+        return block.seal()
 
+    @timed('validation_time', 'chain')
     def validate_chain(self, chain: Blockchain) -> bool:  # called when incoming to network for first time
-        """Checks validity of chain based on validity of included transactions and updates NBCs of nodes
-         according to them.
+        """Checks validity of chain based on validity of its blocks and included transactions and updates NBCs
+        of nodes according to them, rebuilding the chain block by block. The blocks at the start of chain
+        which are in the store were validated before the node restarted, so only their hashes are checked.
 
         Parameters
         ----------
@@ -579,81 +1246,161 @@ class Node:
         Returns
         -------
         bool
-            whether the chain was valid or not. It wouldn't be valid in case an included transaction was
-            invalid.
+            whether the chain was valid or not. It wouldn't be valid in case an included block or transaction
+            was invalid.
         """
-        gen = chain[0]
+        blocks = list(chain)
+        gen = blocks[0]
         trans = gen.listOfTransactions[0]
-        self.NBCs[trans['receiver_address']] = [trans['transaction_outputs'][0]]
-        for x in chain[1:]:
-            for t in x.listOfTransactions:
-                if self.validate_transaction(t):
-                    self.update_NBCs(t)
-                else:
-                    print('Invalid chain due to invalid transaction in it.')
+        self.NBCs.add(trans['transaction_outputs'][0])
+        if trans['receiver_address'] == self.wallet.address:   # the bootstrap node restoring its chain
+            self.wallet.balance += trans['amount']
+        # transactions are checked against the chain built so far, not against the whole chain
+        self.chain = Blockchain.from_blocks(blocks[:1])
+        self.undo_log = [[]]
+        trusted = self.store.common(blocks) if self.store is not None else 0
+        for start in range(1, len(blocks), VERIFY_BATCH):
+            batch = blocks[start:start + VERIFY_BATCH]
+            self.verify_signatures([t for x in batch[max(trusted - start, 0):] for t in x.listOfTransactions])
+            for i, x in enumerate(batch, start):
+                if not self.check_block(x, self.chain[-1], self.chain.next_difficulty()) or \
+                        not self.apply_block(x, validate=i >= trusted):
+                    print('Invalid chain due to invalid block or transaction in it.')
                     return False
         return True
 
-    # given a new chain recalculate node's NBCs
-    def recalculate_NBCs(self, chain: Blockchain) -> None:
-        """Replaces blockchain with chain and recalculates NBCs of nodes and pending transactions according to
-        included transactions.
+    # given the blocks of a longer chain after a common block recalculate node's NBCs
+    def recalculate_NBCs(self, fork: int, blocks: list[Block]) -> bool:
+        """Rolls the chain back to position fork using the undo log and applies blocks after it, validating
+        only them, so that the work done depends on the depth of the fork and not on the length of the
+        chain. Transactions of the orphaned blocks and pending transactions which are still valid become
+        pending again. In case of an invalid block the chain is left as it was.
 
         Parameters
         ----------
-        chain : Blockchain
-            The chain whose transactions are to be processed.
+        fork : int
+            The position of the last block the chain has in common with the new chain.
+        blocks : list[Block]
+            The blocks of the new chain after fork.
+
+        Returns
+        -------
+        bool
+            whether the chain was replaced or not.
         """
-        back_trans = self.transactions
-        for k in self.NBCs:
-            self.NBCs[k] = []
-        self.chain = chain
+        # pending transactions were applied after the tip, so they are undone first
+        back_trans = []
+        for t, spent in reversed(self.transactions.clear()):
+            self.undo_NBCs(t, spent)
+            back_trans.append(t)
+        back_trans.reverse()
+        orphaned = self.rollback(fork + 1)
+        valid = True
+        self.verify_signatures([t for block in blocks for t in block.listOfTransactions])
+        for block in blocks:
+            if not self.check_block(block, self.chain[-1], self.chain.next_difficulty()) or \
+                    not self.apply_block(block, validate=True):
+                valid = False
+                break
+        if not valid:
+            self.rollback(fork + 1)
+            for block in orphaned:
+                self.apply_block(block)
+            orphaned = []
         self.block = Block(index=self.chain[-1].index + 1,
                            previousHash=self.chain[-1].hash)
-        list_out = []
-        gen = chain[0]
-        trans = gen.listOfTransactions[0]
-        self.NBCs[trans['receiver_address']] = [trans['transaction_outputs'][0]]
-        for block in self.chain[1:]:
-            for t in block.listOfTransactions:
-                self.update_NBCs(t)
-                if t in back_trans:
-                    list_out.append(t)
-        test_transactions = list(filter(lambda x: x not in list_out, back_trans))
-        self.transactions = []
-        for transaction in test_transactions:
-            if self.validate_transaction(transaction):
-                self.transactions.append(transaction)
-                self.update_NBCs(transaction)
+        self.readmit([t for block in orphaned for t in block.listOfTransactions] + back_trans)
         self.add_transactions_to_block()
+        return valid
+
+    def request_length(self, peer: (str, int, bytes)) -> int:
+        """Returns the length of the chain of a peer or 0 if it couldn't be reached in time.
+
+        Parameters
+        ----------
+        peer : (str, int, bytes)
+            The (ip, port, public_key) of the peer.
+        """
+        try:
+            r = requests.get(f'http://{peer[0]}:{peer[1]}/chainLength/', timeout=SYNC_TIMEOUT)
+            return r.json()['length']
+        except (RequestException, ValueError, KeyError) as e:
+            print(f'Exception {e} occurred while trying to get '
+                  f'chain length of node {peer[0]}:{peer[1]}')
+            return 0
+
+    def request_blocks(self, peer: (str, int, bytes)) -> (int, list[Block]):
+        """Finds the last block the chain has in common with the chain of a peer and downloads the peer's
+        blocks after it.
+
+        Parameters
+        ----------
+        peer : (str, int, bytes)
+            The (ip, port, public_key) of the peer.
+
+        Returns
+        -------
+        int
+            the position of the common block in the chain (-1 if there isn't any)
+        list[Block]
+            the peer's blocks after the common block
+        """
+        with self.lock:
+            locator = self.chain.locator()
+        r = requests.post(f'http://{peer[0]}:{peer[1]}/locate/', json={'locator': locator}, timeout=SYNC_TIMEOUT)
+        fork = r.json()['fork']
+        if fork < 0:
+            return fork, []
+        r = requests.get(f'http://{peer[0]}:{peer[1]}/getBlocks/{fork + 1}', timeout=SYNC_TIMEOUT)
+        return fork, decode_blocks(r.content)
 
     def resolve_conflicts(self, app: flask.app.Flask) -> None:
-        """Finds chain of greatest length across the network. If this chain, is longer than current
-        node's chain, replaces node's chain with it and recalculate NBCs and pending transactions.
+        """Finds chain of greatest length across the network, asking all peers in parallel. If this chain
+        is longer than current node's chain, fetches only its blocks after the common ancestor, validates
+        them and replaces node's blocks after the common ancestor with them.
 
         Parameters
         ----------
         app: flask.app.Flask
             The Flask environment in order to be able to create http requests.
         """
-        with app.app_context():
-            with self.lock:
-                chains = []
-                for x in self.ring:
-                    if x[2] == self.ring[self.id][2]:
-                        continue
-                    addr = f'http://{x[0]}:{x[1]}/getChain/'
+        if not self.sync_lock.acquire(blocking=False):
+            self.resolutions.labels('skipped').inc()
+            return
+        outcome = 'kept'
+        try:
+            with app.app_context():
+                peers = [x for x in self.ring if x[2] != self.wallet.public_key]
+                if not peers:
+                    return
+                with ThreadPoolExecutor(max_workers=len(peers)) as executor:
+                    lengths = list(executor.map(self.request_length, peers))
+                candidates = sorted(zip(lengths, range(len(peers))), reverse=True)
+                for length, i in candidates:
+                    if length <= len(self.chain):
+                        break
+                    x = peers[i]
                     try:
-                        r = requests.get(addr)
-                    except RequestException as e:
+                        fork, blocks = self.request_blocks(x)
+                    except (RequestException, ValueError, KeyError) as e:
                         print(f'Exception {e} occurred while trying to get '
-                              f'chain of node {x[0]}:{x[1]}')
-                    info = jsonpickle.decode(r.json(), keys=True)['chain']
-                    chains.append((x, info))
-                dominant, chain = sorted(chains, key=lambda t: len(t[1]), reverse=True)[0]
-                if len(chain) <= len(self.chain):
-                    dominant = None
-                if dominant:
-                    # based upon dominant chain recalculate node's NBCs
-                    self.recalculate_NBCs(chain)
-                    print('I replaced my chain')
+                              f'blocks of node {x[0]}:{x[1]}')
+                        continue
+                    if fork < 0:
+                        print(f'No common block with node {x[0]}:{x[1]}')
+                        continue
+                    with self.lock:
+                        # the chain may have changed while waiting for the peer
+                        if fork >= len(self.chain) or not blocks or \
+                                blocks[0].previousHash != self.chain[fork].hash or \
+                                fork + 1 + len(blocks) <= len(self.chain):
+                            continue
+                        replaced = self.recalculate_NBCs(fork, blocks)
+                        self.publish()
+                        if replaced:
+                            print(f'I replaced my chain after block {fork}')
+                            outcome = 'replaced'
+                            return
+        finally:
+            self.resolutions.labels(outcome).inc()
+            self.sync_lock.release()
@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+import requests
+from requests import RequestException
+from Wire import HEADERS, batch_transactions
+
+
+class Peer:
+    """
+        A long-lived sender of messages to another node of the network, over a
+        keep-alive http session
+
+        Attributes
+        ----------
+        ip : str
+            the IPv4 address of the peer
+        port : int
+            the port on which the NoobCash application of the peer listens
+        session : requests.Session
+            the pooled http connection to the peer
+        queue : queue.Queue
+            the bounded queue of (endpoint, payload, time queued) messages waiting to be sent
+        retries : int
+            how many times a failed message is sent again, waiting backoff, 2 * backoff, ... seconds
+        batch_window : float
+            how long (in seconds) a transaction waits for others to be sent along with it
+        batch_size : int
+            the maximum number of transactions sent in one message
+        sent : int
+            the number of messages delivered to the peer
+        failed : int
+            the number of messages given up after all retries
+        dropped : int
+            the number of messages dropped because the queue was full
+        latency : float
+            the latency of the last delivered message in seconds
+        total_latency : float
+            the sum of the latencies of all delivered messages in seconds
+        delivery_time : HistogramValue
+            observes the seconds from queueing every delivered message until the peer answered (default None)
+    """
+
+    def __init__(self, ip, port, queue_size=1000, retries=3, backoff=0.1, timeout=10,
+                 batch_window=0.005, batch_size=64, delivery_time=None):
+        self.ip = ip
+        self.port = port
+        self.session = requests.Session()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.latency = 0.0
+        self.total_latency = 0.0
+        self.delivery_time = delivery_time
+        self.thread = threading.Thread(target=self.run, name=f'sending to {ip}:{port}', daemon=True)
+        self.thread.start()
+
+    def send(self, endpoint, payload):
+        # never blocks the caller, a message which doesn't fit in the queue is dropped
+        try:
+            self.queue.put_nowait((endpoint, payload, time.time()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print(f'Queue to node {self.ip}:{self.port} is full, dropped message to {endpoint}')
+            return False
+
+    def run(self):
+        pending = None
+        while True:
+            endpoint, payload, queued = pending or self.queue.get()
+            pending = None
+            if endpoint != '/addTransaction/' or self.batch_size <= 1:
+                self.post(endpoint, payload, queued)
+                continue
+            # coalesce the transactions which follow within the window, stop at any other message
+            batch = [payload]
+            deadline = time.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item[0] != '/addTransaction/':
+                    pending = item
+                    break
+                batch.append(item[1])
+            # the batch waited as long as its first transaction
+            if len(batch) == 1:
+                self.post(endpoint, payload, queued)
+            else:
+                self.post('/addTransactions/', batch_transactions(batch), queued)
+
+    def post(self, endpoint, payload, queued=None):
+        addr = f'http://{self.ip}:{self.port}{endpoint}'
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            start = time.time()
+            try:
+                r = self.session.post(addr, data=payload, headers=HEADERS, timeout=self.timeout)
+            except RequestException as e:
+                print(f'Exception {e} occurred while sending to node {self.ip}:{self.port}')
+                continue
+            # a rejected message (4xx) is delivered anyway, only server errors are retried
+            if r.status_code < 500:
+                self.latency = time.time() - start
+                self.total_latency += self.latency
+                self.sent += 1
+                if self.delivery_time is not None and queued is not None:
+                    self.delivery_time.observe(time.time() - queued)
+                return r
+        self.failed += 1
+        print(f'Gave up sending {endpoint} to node {self.ip}:{self.port}')
+        return None
+
+    def stats(self):
+        return {
+            'ip': self.ip,
+            'port': self.port,
+            'queue': self.queue.qsize(),
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'latency': self.latency,
+            'mean_latency': self.total_latency / self.sent if self.sent else 0.0
+        }
@@ -0,0 +1,124 @@
+from Crypto.PublicKey import RSA, ECC
+from Crypto.Signature import pkcs1_15, DSS, eddsa
+
+
+class SignatureScheme:
+    """
+        A kind of key pair whose owner signs the hashes of transactions. Keys are exported as PEM, which tells
+        the schemes apart, so nodes of the same network may use different ones
+
+        Attributes
+        ----------
+        name : str
+            the name of the scheme, as given in SIGNATURE_SCHEME
+        signature_size : int
+            the length of a signature in bytes
+    """
+
+    name = None
+    signature_size = None
+
+    def generate(self):
+        # (public key, private key) of a new key pair
+        raise NotImplementedError
+
+    def public_key(self, private_key):
+        # the public key of a private key of the scheme
+        raise NotImplementedError
+
+    def cipher(self, key):
+        # the parsed public or private key, with verify(hash, signature) and sign(hash) respectively,
+        # ValueError if key doesn't belong to the scheme
+        raise NotImplementedError
+
+
+class RSAScheme(SignatureScheme):
+    # PKCS#1 v1.5 with 2048 bit keys, the original scheme of the network
+    name = 'rsa'
+    signature_size = 256
+
+    def generate(self):
+        key = RSA.generate(2048)
+        return key.public_key().export_key('PEM'), key.export_key('PEM')
+
+    def public_key(self, private_key):
+        return RSA.importKey(private_key).public_key().export_key('PEM')
+
+    def cipher(self, key):
+        return pkcs1_15.new(RSA.importKey(key))
+
+
+class ECCScheme(SignatureScheme):
+    # a scheme of elliptic curve keys, curve is the name ECC.generate takes and curve_name the one of a key
+    curve = None
+    curve_name = None
+
+    def generate(self):
+        key = ECC.generate(curve=self.curve)
+        return key.public_key().export_key(format='PEM').encode(), key.export_key(format='PEM').encode()
+
+    def import_key(self, key):
+        key = ECC.import_key(key)
+        if key.curve != self.curve_name:
+            raise ValueError(f'Not a {self.curve_name} key: {key.curve}')
+        return key
+
+    def public_key(self, private_key):
+        return self.import_key(private_key).public_key().export_key(format='PEM').encode()
+
+
+class ECDSAScheme(ECCScheme):
+    # ECDSA on NIST P-256, with deterministic nonces (RFC 6979) so signing doesn't need the random generator
+    name = 'ecdsa'
+    signature_size = 64
+    curve = 'P-256'
+    curve_name = 'NIST P-256'
+
+    def cipher(self, key):
+        return DSS.new(self.import_key(key), 'deterministic-rfc6979')
+
+
+class Ed25519Cipher:
+    # Ed25519 signs messages rather than SHA256 hashes, so the digest of the hash is signed
+    def __init__(self, key):
+        self.inner = eddsa.new(key, 'rfc8032')
+
+    def sign(self, h):
+        return self.inner.sign(h.digest())
+
+    def verify(self, h, signature):
+        self.inner.verify(h.digest(), signature)
+
+
+class Ed25519Scheme(ECCScheme):
+    name = 'ed25519'
+    signature_size = 64
+    curve = 'Ed25519'
+    curve_name = 'Ed25519'
+
+    def cipher(self, key):
+        return Ed25519Cipher(self.import_key(key))
+
+
+SCHEMES = {x.name: x for x in (RSAScheme(), ECDSAScheme(), Ed25519Scheme())}
+
+
+def scheme_of(key):
+    # the scheme a public or private key belongs to
+    for scheme in SCHEMES.values():
+        try:
+            scheme.cipher(key)
+        except (ValueError, TypeError, IndexError):
+            continue
+        return scheme
+    raise ValueError('Key of an unknown signature scheme')
+
+
+def load_cipher(key):
+    # the cipher of a public or private key of any scheme
+    for scheme in SCHEMES.values():
+        try:
+            return scheme.cipher(key)
+        except (ValueError, TypeError, IndexError):
+            continue
+    raise ValueError('Key of an unknown signature scheme')
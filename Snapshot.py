@@ -0,0 +1,44 @@
+from collections import namedtuple
+
+
+class Snapshot(namedtuple('Snapshot', ['blocks', 'length', 'heights', 'balances', 'wallet_balance',
+                                       'transactions'])):
+    """
+        An immutable view of the state of a node, published after every change so that it can be read
+        without taking the node's lock
+
+        Attributes
+        ----------
+        blocks : list[Block]
+            the blocks of the chain, only the first length of them belong to the snapshot. Later blocks may
+            be appended meanwhile, but the first length are never modified since the chain is copied
+            instead of truncated in place
+        length : int
+            the length of the chain
+        heights : dict[str, int]
+            the position of every block of the chain by its hash, shared with the chain (so it may be ahead
+            of the snapshot)
+        balances : dict[bytes, int]
+            the balance of every owner, shared with the UTXO set until it changes (see UTXOSet.view)
+        wallet_balance : int
+            the balance of the node's wallet
+        transactions : PendingView
+            the pending transactions in order of arrival (see Mempool.view)
+    """
+
+    __slots__ = ()
+
+    def chain(self):
+        return self.blocks[:self.length]
+
+    def tip(self):
+        return self.blocks[self.length - 1] if self.length else None
+
+    def fork_point(self, locator):
+        # position of the last block which is also in the locator of another chain (-1 if none), a block
+        # the shared index no longer knows is skipped in favour of an earlier one of the locator
+        for block_hash in locator:
+            i = self.heights.get(block_hash)
+            if i is not None and i < self.length and self.blocks[i].hash == block_hash:
+                return i
+        return -1
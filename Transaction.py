@@ -2,44 +2,47 @@ import time
 import uuid
 from collections import OrderedDict
 from Crypto.Hash import SHA256
-from Crypto.PublicKey import RSA
-from Crypto.Signature import pkcs1_15
+from SignatureScheme import load_cipher
+from UTXOSet import UTXO
+
+
+def transaction_hash(sender_address, receiver_address, amount, timestamp):
+    # the hash which is signed by the sender and whose hex digest is the transaction's id,
+    # addresses are fingerprints of public keys
+    return SHA256.new((sender_address + receiver_address + str(amount) + str(timestamp)).encode())
 
 
 class Transaction:
+    # no per instance dict, and no field can change once the transaction is signed
+    __slots__ = ('sender_address', 'receiver_address', 'amount', 'timestamp', 'transaction_id',
+                 'transaction_inputs', 'transaction_outputs', 'signature')
 
     def __init__(self, sender_address, sender_private_key, receiver_address, value, UTXOs):
         self.sender_address = sender_address
         self.receiver_address = receiver_address
         self.amount = value
         self.timestamp = time.time()
-        self.transaction_id = SHA256.new((sender_address.decode('utf-8') + receiver_address.decode('utf-8') +
-                                          str(value) + str(self.timestamp)).encode())
-        self.transaction_inputs = UTXOs
+        self.transaction_id = transaction_hash(sender_address, receiver_address, value, self.timestamp)
+        self.transaction_inputs = tuple(UTXOs)
         self.transaction_outputs = self.create_transaction_outputs()
         self.signature = self.sign_transaction(sender_private_key)
 
+    def __setattr__(self, name, value):
+        if getattr(self, 'signature', None) is not None:
+            raise AttributeError('A signed transaction cannot be modified')
+        object.__setattr__(self, name, value)
+
     def create_transaction_outputs(self):
         outputs = []
         rest = sum([x['amount'] for x in self.transaction_inputs]) - self.amount
         if rest > 0:
-            outputs.append(OrderedDict({
-                'id': uuid.uuid4(),
-                'trans_id': self.transaction_id.hexdigest(),
-                'receiver': self.sender_address,
-                'amount': rest,
-            }))
-        outputs.append(OrderedDict({
-            'id': uuid.uuid4(),
-            'trans_id': self.transaction_id.hexdigest(),
-            'receiver': self.receiver_address,
-            'amount': self.amount,
-        }))
-        return outputs
+            outputs.append(UTXO(uuid.uuid4().bytes, self.transaction_id.hexdigest(), self.sender_address, rest))
+        outputs.append(UTXO(uuid.uuid4().bytes, self.transaction_id.hexdigest(), self.receiver_address, self.amount))
+        return tuple(outputs)
 
     def sign_transaction(self, p_k):
-        private_key = RSA.importKey(p_k)
-        cipher = pkcs1_15.new(private_key)
+        # p_k is the sender's private key of any scheme, or its cipher parsed once (see Wallet.signer)
+        cipher = p_k if hasattr(p_k, 'sign') else load_cipher(p_k)
         signature = cipher.sign(self.transaction_id)
         self.transaction_id = self.transaction_id.hexdigest()
         return signature
@@ -52,6 +55,13 @@ class Transaction:
                    self.transaction_outputs == other.transaction_outputs and self.signature == other.signature
         return False
 
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name in self.__slots__:
+            object.__setattr__(self, name, state[name])
+
     def to_dict(self):
         return OrderedDict({
             'transaction_id': self.transaction_id,
@@ -0,0 +1,144 @@
+# names of the fields of an output when read as a mapping, the output of genesis names its transaction id
+# 'transaction_id' instead of 'trans_id'
+FIELDS = {'id': 'id', 'trans_id': 'trans_id', 'receiver': 'receiver', 'amount': 'amount'}
+GENESIS_FIELDS = {'id': 'id', 'transaction_id': 'trans_id', 'receiver': 'receiver', 'amount': 'amount'}
+
+
+class UTXO:
+    """
+        An immutable transaction output. It can also be read as the mapping outputs used to be,
+        i.e. output['id'], output['receiver'] etc.
+
+        Attributes
+        ----------
+        id : bytes
+            16 random bytes which uniquely identify the output
+        trans_id : str
+            the id of the transaction which created the output
+        receiver : str
+            the address of the owner of the output
+        amount : int
+            the number of coins of the output
+        genesis : bool
+            whether the output was created by the genesis transaction
+    """
+
+    __slots__ = ('id', 'trans_id', 'receiver', 'amount', 'genesis')
+
+    def __init__(self, id, trans_id, receiver, amount, genesis=False):
+        for name, value in zip(self.__slots__, (id, trans_id, receiver, amount, genesis)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('An output cannot be modified')
+
+    def __getitem__(self, key):
+        return getattr(self, (GENESIS_FIELDS if self.genesis else FIELDS)[key])
+
+    def keys(self):
+        return (GENESIS_FIELDS if self.genesis else FIELDS).keys()
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __eq__(self, other):
+        if isinstance(other, UTXO):
+            return self.id == other.id and self.trans_id == other.trans_id and \
+                   self.receiver == other.receiver and self.amount == other.amount and self.genesis == other.genesis
+        return False
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __reduce__(self):
+        return UTXO, (self.id, self.trans_id, self.receiver, self.amount, self.genesis)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class UTXOSet:
+    """
+        A class used to represent the unspent transaction outputs of the NoobCash network
+
+        Attributes
+        ----------
+        outputs : dict[bytes, UTXO]
+            every unspent output keyed by its id
+        owners : dict[str, dict[bytes, UTXO]]
+            the unspent outputs of every owner (address) keyed by their id, in order of arrival
+        balances : dict[str, int]
+            the sum of the unspent outputs of every owner, copied before it changes once it is shared
+        shared : bool
+            whether balances has been handed out by view and must not be modified in place
+    """
+
+    def __init__(self):
+        self.outputs = {}
+        self.owners = {}
+        self.balances = {}
+        self.shared = False
+
+    def view(self):
+        # the balances as they are now, which stay the same: they are copied by the next change instead
+        self.shared = True
+        return self.balances
+
+    def writable(self):
+        # balances, copied first if a view of them has been handed out
+        if self.shared:
+            self.balances = dict(self.balances)
+            self.shared = False
+        return self.balances
+
+    def register(self, owner):
+        # an owner may be known before receiving any coins
+        if owner not in self.owners:
+            self.owners[owner] = {}
+            self.writable()
+            self.balances[owner] = 0
+
+    def has_owner(self, owner):
+        return owner in self.owners
+
+    def add(self, output):
+        # output ids are unique, a transaction reusing one must have been rejected before
+        if output['id'] in self.outputs:
+            raise ValueError(f"Output {output['id'].hex()} is already unspent")
+        owner = output['receiver']
+        self.register(owner)
+        self.outputs[output['id']] = output
+        self.owners[owner][output['id']] = output
+        self.writable()[owner] += output['amount']
+
+    def spend(self, output_id):
+        # returns the spent output, or None if it wasn't unspent
+        output = self.outputs.pop(output_id, None)
+        if output is not None:
+            owner = output['receiver']
+            del self.owners[owner][output_id]
+            self.writable()[owner] -= output['amount']
+        return output
+
+    def get(self, output_id):
+        return self.outputs.get(output_id)
+
+    def unspent(self, owner):
+        return self.owners.get(owner, {}).values()
+
+    def balance(self, owner):
+        return self.balances.get(owner, 0)
+
+    def clear(self):
+        # forget every output but keep the known owners
+        self.outputs = {}
+        self.balances = dict.fromkeys(self.owners, 0)
+        self.shared = False
+        for owner in self.owners:
+            self.owners[owner] = {}
+
+    def __contains__(self, output_id):
+        return output_id in self.outputs
+
+    def __len__(self):
+        return len(self.outputs)
@@ -0,0 +1,188 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from SignatureScheme import load_cipher
+from Transaction import transaction_hash
+
+
+class LRUCache:
+    """
+        A bounded mapping which forgets the least recently used entry when full
+
+        Attributes
+        ----------
+        size : int
+            the maximum number of entries
+        entries : OrderedDict
+            the entries from least to most recently used
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            return default
+        return self.entries[key]
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# parsed public keys of a verifying process, keyed by the keys themselves
+worker_keys = LRUCache(1024)
+
+
+def watch_parent(parent):
+    # runs in a process of the pool when it starts: exits the process as soon as the node's process is gone,
+    # so that the process doesn't outlive it (keeping its listening socket) when the node is killed
+    def watch():
+        while os.getppid() == parent:
+            time.sleep(1)
+        os._exit(0)
+    threading.Thread(target=watch, daemon=True).start()
+
+
+def check_signature(item):
+    # runs in a process of the pool: whether signature is the signature of the hash of the transaction's
+    # contents by the owner of public_key
+    public_key, sender_address, receiver_address, amount, timestamp, signature = item
+    cipher = worker_keys.get(public_key)
+    if cipher is None:
+        cipher = load_cipher(public_key)
+        worker_keys.put(public_key, cipher)
+    try:
+        cipher.verify(transaction_hash(sender_address, receiver_address, amount, timestamp), signature)
+    except (ValueError, TypeError, IndexError):
+        return False
+    return True
+
+
+class Verifier:
+    """
+        A class used to check signatures of transactions, remembering parsed public keys
+        and signatures which have already been verified
+
+        Attributes
+        ----------
+        keys : LRUCache
+            ciphers of parsed public keys keyed by address (see SignatureScheme)
+        verified : LRUCache
+            (transaction_id, signature) pairs which have been verified successfully
+        lock : threading.Lock
+            a lock protecting the caches
+        workers : int
+            the number of processes checking signatures of many transactions in parallel, 1 for none
+        pool : ProcessPoolExecutor
+            the verifying processes, started the first time they are needed (default None)
+    """
+
+    def __init__(self, key_cache_size=1024, signature_cache_size=100000, workers=1):
+        self.keys = LRUCache(key_cache_size)
+        self.verified = LRUCache(signature_cache_size)
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.pool = None
+
+    def cipher(self, address, public_key):
+        with self.lock:
+            cipher = self.keys.get(address)
+        if cipher is None:
+            cipher = load_cipher(public_key)
+            with self.lock:
+                self.keys.put(address, cipher)
+        return cipher
+
+    def verify(self, transaction, public_key):
+        """Checks that transaction_id is the hash of the transaction's contents and that the signature is
+        the sender's signature of it. Each valid (transaction_id, signature) pair is verified only once.
+
+        Parameters
+        ----------
+        transaction : Transaction
+            The transaction whose signature is to be checked.
+        public_key : bytes
+            The public key of the sender, whose fingerprint is transaction's sender_address.
+
+        Returns
+        -------
+        bool
+            whether the signature was valid or not.
+        """
+        trans_id = transaction_hash(transaction.sender_address, transaction.receiver_address,
+                                    transaction.amount, transaction.timestamp)
+        if trans_id.hexdigest() != transaction.transaction_id:
+            return False
+        memo = (transaction.transaction_id, transaction.signature)
+        with self.lock:
+            if self.verified.get(memo):
+                return True
+        try:
+            self.cipher(transaction.sender_address, public_key).verify(trans_id, transaction.signature)
+        except (ValueError, TypeError, IndexError):
+            return False
+        with self.lock:
+            self.verified.put(memo, True)
+        return True
+
+    def verify_many(self, transactions, public_keys):
+        """Checks the signatures of many transactions at once, spread over the pool of processes, and
+        remembers the valid ones, so that verifying them one by one afterwards costs a lookup.
+
+        Parameters
+        ----------
+        transactions : list[Transaction]
+            The transactions whose signatures are to be checked.
+        public_keys : list[bytes]
+            The public key of the sender of every transaction, None for a sender outside the ring.
+
+        Returns
+        -------
+        list[bool]
+            whether the signature of every transaction was valid or not.
+        """
+        valid = [False] * len(transactions)
+        items, positions = [], []
+        for i, (t, public_key) in enumerate(zip(transactions, public_keys)):
+            if public_key is None:
+                continue
+            with self.lock:
+                known = self.verified.get((t.transaction_id, t.signature))
+            if known:
+                valid[i] = True
+            elif transaction_hash(t.sender_address, t.receiver_address, t.amount,
+                                  t.timestamp).hexdigest() == t.transaction_id:
+                items.append((public_key, t.sender_address, t.receiver_address, t.amount, t.timestamp,
+                              t.signature))
+                positions.append(i)
+        if not items:
+            return valid
+        if self.workers <= 1 or len(items) == 1:
+            results = [self.verify(transactions[i], items[j][0]) for j, i in enumerate(positions)]
+        else:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(self.workers, initializer=watch_parent,
+                                                    initargs=(os.getpid(),))
+            results = self.pool.map(check_signature, items, chunksize=math.ceil(len(items) / self.workers))
+        for i, result in zip(positions, results):
+            valid[i] = result
+            if result:
+                with self.lock:
+                    self.verified.put((transactions[i].transaction_id, transactions[i].signature), True)
+        return valid
@@ -1,22 +1,57 @@
+import os
 from collections import OrderedDict
-from Crypto.PublicKey import RSA
+from Crypto.Hash import SHA256
+from dotenv import load_dotenv
+from SignatureScheme import SCHEMES, scheme_of
+
+load_dotenv()
+SIGNATURE_SCHEME = os.getenv("SIGNATURE_SCHEME", "rsa")
+
+
+def fingerprint(public_key):
+    # the address of a public key: the hex digest of its SHA256, much shorter than the key itself
+    return SHA256.new(public_key).hexdigest()
+
+
+def registration_hash(public_key, ip, port, timestamp):
+    # the hash a node signs when it registers from ip:port, so that only the owner of a key can move its
+    # place in the ring
+    return SHA256.new((fingerprint(public_key) + ip + str(port) + str(timestamp)).encode())
 
 
 class Wallet:
 
-    def __init__(self):
-        self.public_key, self.private_key = self.generateKeyPair()
+    def __init__(self, scheme=SIGNATURE_SCHEME, key_file=None):
+        # with a key file, the keys (and so the address) of an earlier run are kept, whatever their scheme
+        if key_file is not None and os.path.exists(key_file):
+            self.public_key, self.private_key = self.loadKeyPair(key_file)
+        else:
+            self.scheme = SCHEMES[scheme]
+            self.public_key, self.private_key = self.generateKeyPair()
+            if key_file is not None:
+                self.saveKeyPair(key_file)
+        # the private key is parsed once, not every time a transaction is signed
+        self.signer = self.scheme.cipher(self.private_key)
+        self.address = fingerprint(self.public_key)
         self.balance = 0
 
     def wallet_balance(self):
         return self.balance
 
     def generateKeyPair(self):
-        private_key_rsa = RSA.generate(2048)
-        private_key = private_key_rsa.export_key('PEM')
-        public_key_rsa = private_key_rsa.public_key()
-        public_key = public_key_rsa.export_key('PEM')
-        return public_key, private_key
+        return self.scheme.generate()
+
+    def loadKeyPair(self, key_file):
+        with open(key_file, 'rb') as f:
+            private_key = f.read()
+        self.scheme = scheme_of(private_key)
+        return self.scheme.public_key(private_key), private_key
+
+    def saveKeyPair(self, key_file):
+        # only the owner may read the private key
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.private_key)
 
     def to_dict(self):
         return OrderedDict({
@@ -0,0 +1,384 @@
+import struct
+from collections import OrderedDict
+from Block import Block
+from Blockchain import Blockchain
+from Transaction import Transaction
+from UTXOSet import UTXO as Output  # UTXO is the type of a message here
+
+# every message starts with MAGIC, VERSION and its type
+MAGIC = b'NBC'
+VERSION = 7
+CONTENT_TYPE = 'application/octet-stream'
+HEADERS = {'Content-Type': CONTENT_TYPE}
+
+TRANSACTION = 1
+BLOCK = 2
+CHAIN = 3
+UTXO = 4
+RING = 5
+REGISTRATION = 6
+REGISTERED = 7
+TRANSACTIONS = 8
+BLOCKS = 9
+
+# kinds of transactions inside a block
+SIGNED = 0
+GENESIS = 1
+
+
+class Writer:
+    """
+        Appends fields in their binary form to a buffer
+
+        Attributes
+        ----------
+        buffer : bytearray
+            the encoded fields so far
+    """
+
+    def __init__(self, kind=None):
+        self.buffer = bytearray()
+        if kind is not None:
+            self.buffer += MAGIC + struct.pack('!BB', VERSION, kind)
+
+    def pack(self, fmt, *values):
+        self.buffer += struct.pack('!' + fmt, *values)
+
+    def bytes(self, value):
+        self.pack('I', len(value))
+        self.buffer += value
+
+    def str(self, value):
+        self.bytes(value.encode())
+
+    def digest(self, value):
+        # hex digests (ids and addresses) travel as raw 32 bytes
+        self.buffer += bytes.fromhex(value)
+
+    def getvalue(self):
+        return bytes(self.buffer)
+
+
+class Reader:
+    """
+        Reads fields in their binary form from a buffer without copying it, only the decoded
+        fields themselves are materialized
+
+        Attributes
+        ----------
+        view : memoryview
+            the encoded message
+        offset : int
+            where the next field starts
+    """
+
+    def __init__(self, data, kind=None):
+        self.view = memoryview(data)
+        self.offset = 0
+        if kind is not None:
+            magic, version, found = self.take(len(MAGIC)), *self.unpack('BB')
+            if magic != MAGIC or version != VERSION or found != kind:
+                raise ValueError(f'Expected message of type {kind} (version {VERSION})')
+
+    def unpack(self, fmt):
+        try:
+            values = struct.unpack_from('!' + fmt, self.view, self.offset)
+        except struct.error as e:
+            raise ValueError(f'Truncated message: {e}')
+        self.offset += struct.calcsize('!' + fmt)
+        return values
+
+    def take(self, size):
+        if self.offset + size > len(self.view):
+            raise ValueError('Truncated message')
+        value = self.view[self.offset:self.offset + size]
+        self.offset += size
+        return value
+
+    def bytes(self):
+        return self.take(self.unpack('I')[0]).tobytes()
+
+    def str(self):
+        return str(self.take(self.unpack('I')[0]), 'utf-8')
+
+    def digest(self):
+        return self.take(32).hex()
+
+    def end(self):
+        if self.offset != len(self.view):
+            raise ValueError('Trailing bytes in message')
+
+
+def write_utxo(w, output):
+    w.pack('B', output.genesis)
+    w.buffer += output.id
+    w.digest(output.trans_id)
+    w.digest(output.receiver)
+    w.pack('q', output.amount)
+
+
+def read_utxo(r):
+    genesis = r.unpack('B')[0]
+    return Output(r.take(16).tobytes(), r.digest(), r.digest(), r.unpack('q')[0], bool(genesis))
+
+
+def write_transaction(w, t):
+    if isinstance(t, Transaction):
+        w.pack('B', SIGNED)
+        w.digest(t.transaction_id)
+        w.digest(t.sender_address)
+        w.digest(t.receiver_address)
+        w.pack('qdH', t.amount, t.timestamp, len(t.transaction_inputs))
+        for x in t.transaction_inputs:
+            write_utxo(w, x)
+        w.pack('H', len(t.transaction_outputs))
+        for x in t.transaction_outputs:
+            write_utxo(w, x)
+        w.bytes(t.signature)
+    else:
+        w.pack('B', GENESIS)
+        w.digest(t['transaction_id'])
+        w.digest(t['receiver_address'])
+        w.pack('qd', t['amount'], t['timestamp'])
+        write_utxo(w, t['transaction_outputs'][0])
+
+
+def read_transaction(r, genesis=False):
+    # genesis: whether the transaction is the first one of the genesis block, the only place of a GENESIS one
+    if r.unpack('B')[0] == GENESIS:
+        if not genesis:
+            raise ValueError('Genesis transaction outside of the genesis block')
+        t = OrderedDict()
+        t['transaction_id'] = r.digest()
+        t['sender_address'] = 0
+        t['receiver_address'] = r.digest()
+        t['amount'], t['timestamp'] = r.unpack('qd')
+        t['transaction_outputs'] = [read_utxo(r)]
+        return t
+    t = Transaction.__new__(Transaction)
+    t.transaction_id = r.digest()
+    t.sender_address = r.digest()
+    t.receiver_address = r.digest()
+    t.amount, t.timestamp, inputs = r.unpack('qdH')
+    t.transaction_inputs = tuple(read_utxo(r) for _ in range(inputs))
+    t.transaction_outputs = tuple(read_utxo(r) for _ in range(r.unpack('H')[0]))
+    # the transaction is immutable once it has a signature
+    t.signature = r.bytes()
+    return t
+
+
+def write_block(w, block):
+    w.pack('I', block.index)
+    # genesis' previous hash is the number 1
+    if isinstance(block.previousHash, int):
+        w.pack('Bq', 0, block.previousHash)
+    else:
+        w.pack('B', 1)
+        w.str(block.previousHash)
+    w.pack('Qdd', block.nonce, block.timestamp, block.difficulty)
+    w.str(block.hash)
+    w.pack('I', len(block.listOfTransactions))
+    for t in block.listOfTransactions:
+        write_transaction(w, t)
+
+
+def read_block(r, genesis=False):
+    # genesis: whether the block may be the genesis block, the first one of a chain
+    index, = r.unpack('I')
+    previous_hash = r.unpack('q')[0] if r.unpack('B')[0] == 0 else r.str()
+    nonce, timestamp, difficulty = r.unpack('Qdd')
+    block = Block.__new__(Block)
+    block.__setstate__({
+        'index': index,
+        'previousHash': previous_hash,
+        'nonce': nonce,
+        'timestamp': timestamp,
+        'difficulty': difficulty,
+        'hash': r.str(),
+        'listOfTransactions': [read_transaction(r, genesis and index == 1 and i == 0) for i in range(r.unpack('I')[0])]
+    })
+    return block
+
+
+def block_record(block):
+    # a block as it appears inside a chain, length prefixed so that it can be skipped without decoding it
+    encoded = Writer()
+    write_block(encoded, block)
+    record = Writer()
+    record.bytes(encoded.buffer)
+    return record.buffer
+
+
+def write_chain(w, blocks):
+    w.pack('I', len(blocks))
+    for block in blocks:
+        w.buffer += block_record(block)
+
+
+def chain_message(kind, count, records):
+    # a CHAIN or BLOCKS message out of already encoded block records
+    w = Writer(kind)
+    w.pack('I', count)
+    return b''.join((w.buffer, records))
+
+
+def read_blocks(r):
+    blocks = []
+    for _ in range(r.unpack('I')[0]):
+        size, = r.unpack('I')
+        block = Reader(r.take(size))
+        blocks.append(read_block(block, not blocks))
+        block.end()
+    return blocks
+
+
+def read_chain(r):
+    return Blockchain.from_blocks(read_blocks(r))
+
+
+def encode(kind, write, value):
+    w = Writer(kind)
+    write(w, value)
+    return w.getvalue()
+
+
+def decode(kind, read, data):
+    r = Reader(data, kind)
+    value = read(r)
+    r.end()
+    return value
+
+
+def encode_transaction(transaction):
+    return encode(TRANSACTION, write_transaction, transaction)
+
+
+def decode_transaction(data):
+    return decode(TRANSACTION, read_transaction, data)
+
+
+def batch_transactions(messages):
+    # wraps already encoded transaction messages in one message, each of them length prefixed
+    w = Writer(TRANSACTIONS)
+    w.pack('I', len(messages))
+    for message in messages:
+        w.bytes(message)
+    return w.getvalue()
+
+
+def read_transactions(r):
+    return [decode_transaction(r.take(r.unpack('I')[0])) for _ in range(r.unpack('I')[0])]
+
+
+def decode_transactions(data):
+    return decode(TRANSACTIONS, read_transactions, data)
+
+
+def encode_block(block):
+    return encode(BLOCK, write_block, block)
+
+
+def decode_block(data):
+    return decode(BLOCK, read_block, data)
+
+
+def encode_chain(chain):
+    # chain is a Blockchain or a list of blocks
+    return encode(CHAIN, write_chain, list(chain))
+
+
+def decode_chain(data):
+    return decode(CHAIN, read_chain, data)
+
+
+def encode_blocks(blocks):
+    # a part of a chain, same layout as a chain
+    return encode(BLOCKS, write_chain, list(blocks))
+
+
+def decode_blocks(data):
+    return decode(BLOCKS, read_blocks, data)
+
+
+def encode_utxo(output):
+    return encode(UTXO, write_utxo, output)
+
+
+def decode_utxo(data):
+    return decode(UTXO, read_utxo, data)
+
+
+def write_ring(w, ring):
+    w.pack('I', len(ring))
+    for ip, port, public_key in ring:
+        w.str(ip)
+        w.pack('H', port)
+        w.bytes(public_key)
+
+
+def read_ring(r):
+    ring = []
+    for _ in range(r.unpack('I')[0]):
+        ip = r.str()
+        port, = r.unpack('H')
+        ring.append((ip, port, r.bytes()))
+    return ring
+
+
+def encode_ring(ring):
+    return encode(RING, write_ring, ring)
+
+
+def decode_ring(data):
+    return decode(RING, read_ring, data)
+
+
+def write_registration(w, info):
+    w.bytes(info['public_key'])
+    w.str(info['ip'])
+    w.pack('HBd', info['port'], info['resume'], info['timestamp'])
+    w.bytes(info['signature'])
+
+
+def read_registration(r):
+    info = {'public_key': r.bytes(), 'ip': r.str()}
+    info['port'], resume, info['timestamp'] = r.unpack('HBd')
+    info['resume'] = bool(resume)
+    info['signature'] = r.bytes()
+    return info
+
+
+def encode_registration(info):
+    # info = {'public_key', 'ip', 'port', 'resume', 'timestamp', 'signature'} of a node joining the network,
+    # resume if it has stored blocks and fetches the ones it lacks itself instead of getting the whole chain,
+    # signature the node's signature of registration_hash (see Wallet)
+    return encode(REGISTRATION, write_registration, info)
+
+
+def decode_registration(data):
+    return decode(REGISTRATION, read_registration, data)
+
+
+def write_registered(w, info):
+    w.pack('I', info['node_id'])
+    write_chain(w, list(info['chain']))
+    w.pack('B', info['ring'] is not None)
+    if info['ring'] is not None:
+        write_ring(w, info['ring'])
+
+
+def read_registered(r):
+    info = {'node_id': r.unpack('I')[0]}
+    info['chain'] = read_chain(r)
+    info['ring'] = read_ring(r) if r.unpack('B')[0] else None
+    return info
+
+
+def encode_registered(info):
+    # info = {'node_id', 'chain', 'ring'} given by the bootstrap node to a joining node, ring is None unless
+    # the node rejoins and chain is empty if it resumes
+    return encode(REGISTERED, write_registered, info)
+
+
+def decode_registered(data):
+    return decode(REGISTERED, read_registered, data)
@@ -2,16 +2,19 @@ import netifaces as ni
 import json
 import socket
 import threading
-import jsonpickle
 import requests
 import os
 from flask import Flask, jsonify, request, Response, abort
 from flask_cors import CORS
-from Node import Node
+from Node import Node, READY_TIMEOUT, WALLET_KEY_FILE, BLOCK_STORE
 from dotenv import load_dotenv
 from werkzeug.exceptions import HTTPException
 import time
 from Transaction import Transaction
+from Wallet import fingerprint, registration_hash
+from ChainCache import ChainCache
+from Wire import HEADERS, CONTENT_TYPE, decode_ring, decode_registration, encode_registration, \
+    decode_registered, encode_registered, decode_transaction, decode_transactions, decode_block
 
 load_dotenv()
 N = int(os.getenv("N"))
@@ -19,6 +22,7 @@ bootstrap_ip = os.getenv("BOOTSTRAP_IP")
 bootstrap_port = int(os.getenv("BOOTSTRAP_PORT"))
 app = Flask(__name__)
 CORS(app)
+chain_cache = ChainCache()
 
 
 # execute transactions in given file matching our node_id
@@ -28,13 +32,8 @@ def read_trans():
                 open(f'results/result_{my_node.id}.txt', "w") as test_file:
 
             trans_id = 0
-            while True:
-                activated_nodes = 0
-                for node_NBCs in my_node.NBCs.values():
-                    if len(node_NBCs) != 0:
-                        activated_nodes += 1
-                if activated_nodes == N:
-                    break
+            # wait until every node has received its coins
+            my_node.network_ready.wait()
 
             print('So it begins!')
             for line in f:
@@ -48,7 +47,7 @@ def read_trans():
                     print(f'Trans {trans_id} failed!')
                     continue
 
-                receiver_addr = my_node.ring[receiver_id][2]
+                receiver_addr = fingerprint(my_node.ring[receiver_id][2])
 
                 flag = my_node.create_transaction(receiver_addr, amount)
                 if flag:
@@ -69,10 +68,10 @@ def hello():
 @app.route('/transactions/get', methods=['GET'])
 def get_transactions():
     info = []
-    for x in my_node.transactions:
+    for x in my_node.snapshot.transactions:
         info.append({
-            'sender': find_id(my_node.ring, x.sender_address),
-            'receiver': find_id(my_node.ring, x.receiver_address),
+            'sender': my_node.ring_index.get(x.sender_address),
+            'receiver': my_node.ring_index.get(x.receiver_address),
             'amount': x.amount,
             'timestamp': x.timestamp
         })
@@ -83,11 +82,14 @@ def get_transactions():
 # update ring based on info sent by bootstrap node
 @app.route('/setRing/', methods=['POST'])
 def updateRing():
-    ring = jsonpickle.decode(request.json)
-    if ring is None:
-        abort(404, description="Parameter not found in setRing endpoint")
+    try:
+        ring = decode_ring(request.get_data())
+    except ValueError:
+        abort(400, description="Malformed ring in setRing endpoint")
+    # later rings only tell the new address of a node which rejoined
+    first = not my_node.ring
     my_node.set_ring(ring)
-    if test:
+    if test and first:
         thread = threading.Thread(target=read_trans, name='make transactions')
         thread.start()
     return Response(status=200)
@@ -97,20 +99,25 @@ def updateRing():
 # insert new node into ring and return its id and blockchain so far
 @app.route('/registerNode/', methods=['POST'])
 def registerNode():
-    info = jsonpickle.decode(request.json)
-    if info is None:
-        abort(404, description="Parameter not found in registerNode endpoint")
-
-    registered_node_id, my_chain = my_node.register_node_to_ring(info['public_key'],
-                                                                 info['ip'], info['port'])
+    try:
+        info = decode_registration(request.get_data())
+    except ValueError:
+        abort(400, description="Malformed registration in registerNode endpoint")
+
+    registered_node_id, my_chain, ring = my_node.register_node_to_ring(info['public_key'], info['ip'], info['port'],
+                                                                       info['timestamp'], info['signature'])
+    if registered_node_id is None:
+        abort(403, description="Unsigned or stale registration in registerNode endpoint")
+    # a node which resumes from its store fetches the blocks it lacks itself
     updated_info = {
         'node_id': registered_node_id,
-        'chain': my_chain
+        'chain': [] if info['resume'] else my_chain,
+        'ring': ring
     }
-    if updated_info['node_id'] == N - 1 and test:
+    if updated_info['node_id'] == N - 1 and ring is None and test:
         thread = threading.Thread(target=read_trans, name='make transactions')
         thread.start()
-    return jsonify(jsonpickle.encode(updated_info))
+    return Response(encode_registered(updated_info), mimetype=CONTENT_TYPE)
 
 
 # create a transaction sending given amount coins to node with given id
@@ -122,7 +129,7 @@ def create_transaction():
     elif info['id'] not in range(N) or info['amount'] < 0:
         return Response(status=400)
     else:
-        receiver_addr = my_node.ring[info['id']][2]
+        receiver_addr = fingerprint(my_node.ring[info['id']][2])
         flag = my_node.create_transaction(receiver_addr, info['amount'])
         if flag:
             return Response(status=200)
@@ -133,11 +140,12 @@ def create_transaction():
 # receive (broadcast) transaction executed by someone except for me
 @app.route('/addTransaction/', methods=['POST'])
 def add_transaction():
-    while not my_node.chain:
-        pass
-    info = jsonpickle.decode(request.json)
-    if info is None:
-        abort(404, description="Parameter not found in addTransaction endpoint")
+    if not my_node.chain_ready.wait(READY_TIMEOUT):
+        abort(503, description="Node has not joined the network yet")
+    try:
+        info = decode_transaction(request.get_data())
+    except ValueError:
+        abort(400, description="Malformed transaction in addTransaction endpoint")
     flag = my_node.add_transaction_to_block(info)
     if flag:
         return Response(status=200)
@@ -145,12 +153,26 @@ def add_transaction():
         return Response(status=400)
 
 
+# receive a batch of (broadcast) transactions executed by others and validate it in one pass
+@app.route('/addTransactions/', methods=['POST'])
+def add_transactions():
+    if not my_node.chain_ready.wait(READY_TIMEOUT):
+        abort(503, description="Node has not joined the network yet")
+    try:
+        info = decode_transactions(request.get_data())
+    except ValueError:
+        abort(400, description="Malformed transactions in addTransactions endpoint")
+    flags = my_node.add_batch_to_block(info)
+    return jsonify(added=flags.count(True), rejected=flags.count(False)), 200
+
+
 # receive (broadcast) block found by someone except for me
 @app.route('/addBlock/', methods=['POST'])
 def add_block():
-    info = jsonpickle.decode(request.json)
-    if info is None:
-        abort(404, description="Parameter not found in addBlock endpoint")
+    try:
+        info = decode_block(request.get_data())
+    except ValueError:
+        abort(400, description="Malformed block in addBlock endpoint")
     flag = my_node.create_new_block(info)
     if flag:
         return Response(status=200)
@@ -161,63 +183,143 @@ def add_block():
 # return the length of my blockchain
 @app.route('/chainLength/', methods=['GET'])
 def length_of_chain():
-    return jsonify(length=len(my_node.chain)), 200
+    snapshot = my_node.snapshot
+    etag = tip_etag(snapshot)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    response = jsonify(length=snapshot.length, hash=snapshot.tip().hash if snapshot.length else None)
+    response.set_etag(etag)
+    return response, 200
+
+
+# return the position of the last block of my chain which is found in the given locator
+@app.route('/locate/', methods=['POST'])
+def locate():
+    info = request.get_json(silent=True)
+    if not info or not isinstance(info.get('locator'), list):
+        abort(400, description="Parameter not found in locate endpoint")
+    snapshot = my_node.snapshot
+    return jsonify(fork=snapshot.fork_point(info['locator']), length=snapshot.length), 200
+
+
+# return the blocks of my blockchain from the given position on
+@app.route('/getBlocks/<int:start>', methods=['GET'])
+def get_blocks(start):
+    snapshot = my_node.snapshot
+    return Response(chain_cache.blocks(snapshot.blocks, snapshot.length, start), mimetype=CONTENT_TYPE), 200
 
 
 # return my blockchain
 @app.route('/getChain/', methods=['GET'])
 def get_chain():
-    return jsonify(jsonpickle.encode(keys=True, value={'chain': my_node.chain})), 200
+    snapshot = my_node.snapshot
+    etag = tip_etag(snapshot)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    response = Response(chain_cache.chain(snapshot.blocks, snapshot.length), mimetype=CONTENT_TYPE)
+    response.set_etag(etag)
+    return response, 200
+
+
+# return the outbound queue depth and send latency of every peer
+@app.route('/peers/', methods=['GET'])
+def get_peers():
+    return jsonify(peers=[x.stats() for x in list(my_node.peers.values())]), 200
+
+
+# return the metrics of the node in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(my_node.metrics.render(), mimetype='text/plain; version=0.0.4'), 200
 
 
 # return the balance of my wallet
 @app.route('/balance/', methods=['GET'])
 def get_balance():
-    return jsonify(balance=my_node.wallet.wallet_balance()), 200
+    return jsonify(balance=my_node.snapshot.wallet_balance), 200
 
 
 # return all transactions contained in the last block of blockchain
 @app.route('/viewLast/', methods=['GET'])
 def get_last_trans():
-    block_trans = my_node.chain[-1].listOfTransactions
+    snapshot = my_node.snapshot
+    # ids of nodes are known once the ring is complete
+    etag = f'{tip_etag(snapshot)}-{len(my_node.ring)}'
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    tip = snapshot.tip()
+    block_trans = tip.listOfTransactions if tip else []
     info = []
     for x in block_trans:
         if isinstance(x, Transaction):
             info.append({
-                'sender': find_id(my_node.ring, x.sender_address),
-                'receiver': find_id(my_node.ring, x.receiver_address),
+                'sender': my_node.ring_index.get(x.sender_address),
+                'receiver': my_node.ring_index.get(x.receiver_address),
                 'amount': x.amount,
                 'timestamp': x.timestamp
             })
         else:
             info.append({
-                'sender': find_id(my_node.ring, x['sender_address']),
-                'receiver': find_id(my_node.ring, x['receiver_address']),
+                'sender': my_node.ring_index.get(x['sender_address']),
+                'receiver': my_node.ring_index.get(x['receiver_address']),
                 'amount': x['amount'],
                 'timestamp': x['timestamp']
             })
-    return jsonify(info), 200
+    response = jsonify(info)
+    response.set_etag(etag)
+    return response, 200
+
 
+# name the state of the chain by its tip, the hash of a block depends on all previous ones
+def tip_etag(snapshot):
+    return f'{snapshot.length}-{snapshot.tip().hash}' if snapshot.length else 'empty'
 
-# return id of node with key as public key
-def find_id(ring, key):
-    for i in range(len(ring)):
-        if ring[i][2] == key:
-            return i
+
+# answer 304 to a client which already has the representation named etag
+def not_modified(etag):
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def wait_listening(ip, port):
+    # the bootstrap node sends the ring and coins to a node right after it registers
+    while True:
+        try:
+            socket.create_connection((ip, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
 
 
 # announce myself to bootstrap node
 def announce_me():
+    wait_listening(my_node.ip, my_node.port)
     with app.app_context():
+        resume = my_node.store is not None and len(my_node.store) > 0
+        timestamp = time.time()
         info = {
             'public_key': my_node.wallet.public_key,
             'ip': my_node.ip,
-            'port': my_node.port
+            'port': my_node.port,
+            'resume': resume,
+            'timestamp': timestamp,
+            'signature': my_node.wallet.signer.sign(registration_hash(my_node.wallet.public_key, my_node.ip,
+                                                                      my_node.port, timestamp))
         }
-        con = jsonpickle.encode(info)
-        res = requests.post(f'http://{bootstrap_ip}:{bootstrap_port}/registerNode/', json=con)
-        res_j = jsonpickle.decode(res.json())
-        my_node.update(res_j['node_id'], res_j['chain'])
+        con = encode_registration(info)
+        res = requests.post(f'http://{bootstrap_ip}:{bootstrap_port}/registerNode/', data=con, headers=HEADERS)
+        res_j = decode_registered(res.content)
+        chain = my_node.resume((bootstrap_ip, bootstrap_port, None)) if resume else res_j['chain']
+        my_node.update(res_j['node_id'], chain)
+        # a node which rejoins gets the ring right away, the others once every node has joined
+        if res_j['ring'] is not None:
+            my_node.set_ring(res_j['ring'])
 
 
 @app.errorhandler(HTTPException)
@@ -241,6 +343,11 @@ if __name__ == '__main__':
     parser.add_argument('-p', '--port', default=5000, type=int, help='port to listen on')
     parser.add_argument('-id', '--id', default=None, type=int, help='id, given for bootstrap')
     parser.add_argument('-test', '--test', action='store_true', help='run tests with given transaction files')
+    parser.add_argument('-host', '--host', default=None, help='address to listen on, the one of eth1 by default')
+    parser.add_argument('-key', '--key-file', default=None,
+                        help='file with the keys of the wallet, created if missing, WALLET_KEY_FILE by default')
+    parser.add_argument('-store', '--store', default=None,
+                        help='segment file of the chain on disk, created if missing, BLOCK_STORE by default')
 
     args = parser.parse_args()
 
@@ -252,14 +359,16 @@ if __name__ == '__main__':
     #host_name = socket.gethostname()
     #host_ip = socket.gethostbyname(host_name)
 
-    host_ip = ni.ifaddresses('eth1')[ni.AF_INET][0]['addr']
+    host_ip = args.host or ni.ifaddresses('eth1')[ni.AF_INET][0]['addr']
 
-    my_node = Node(node_id, host_ip, port)
+    my_node = Node(node_id, host_ip, port, args.key_file or WALLET_KEY_FILE, args.store or BLOCK_STORE)
+    # blocks are served from the store, so that the chain isn't kept encoded in memory as well
+    if my_node.store is not None:
+        chain_cache = my_node.store
 
-    if node_id == 0:
-        my_node.ring = [(host_ip, port, my_node.wallet.public_key)]
-    else:
-        timer = threading.Timer(2, announce_me)
-        timer.start()
+    # the bootstrap node puts itself in the ring
+    if node_id != 0:
+        thread = threading.Thread(target=announce_me, name='announce')
+        thread.start()
 
     app.run(host=host_ip, port=port, threaded=True)
\ No newline at end of file
@@ -0,0 +1,278 @@
+import csv
+import glob
+import json
+import math
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from itertools import product
+import requests
+
+# run from the repository's root:
+# python3 -m benchmarks.cluster [--nodes 5 10] [--capacity 1 5 10] [--difficulty 4 5] [--deadline 0 2]
+#                               [--target 0 1] [--json FILE] [--csv FILE]
+
+HOST = '127.0.0.1'
+FIELDS = ['nodes', 'capacity', 'difficulty', 'deadline', 'target', 'transactions', 'failed', 'confirmed', 'blocks',
+          'same_chains', 'duration', 'throughput', 'latency_p50', 'latency_p95', 'latency_p99', 'block_interval',
+          'final_difficulty']
+
+
+class Watcher(threading.Thread):
+    # polls the tip of a node and records when every tip was first seen, the node answers 304 while
+    # its tip stays the same so polling often is cheap
+    def __init__(self, url, interval):
+        super().__init__(daemon=True)
+        self.url = url
+        self.interval = interval
+        self.seen = {}
+        self.length = 0
+        self.tip = None
+        self.done = threading.Event()
+
+    def run(self):
+        session = requests.Session()
+        etag = None
+        while not self.done.is_set():
+            try:
+                res = session.get(f'{self.url}/chainLength/', headers={'If-None-Match': etag} if etag else {},
+                                  timeout=5)
+                if res.status_code == 200:
+                    now = time.time()
+                    info = res.json()
+                    etag = res.headers.get('ETag')
+                    self.length, self.tip = info['length'], info['hash']
+                    self.seen.setdefault(self.tip, now)
+            except requests.RequestException:
+                pass
+            self.done.wait(self.interval)
+
+
+def configure(args, nodes, capacity, difficulty, deadline, target):
+    # the modules of a node read their configuration from the environment once imported
+    return dict(N=str(nodes), CAPACITY=str(capacity), MINING_DIFFICULTY=str(difficulty), BLOCK_DEADLINE=str(deadline),
+                TARGET_BLOCK_INTERVAL=str(target), BOOTSTRAP_IP=HOST, BOOTSTRAP_PORT=str(args.port),
+                MINING_WORKERS=str(args.workers))
+
+
+def start(args, nodes, capacity, difficulty, deadline, target):
+    env = dict(os.environ, **configure(args, nodes, capacity, difficulty, deadline, target))
+    processes = []
+    for i in range(nodes):
+        command = [sys.executable, 'app.py', '--host', HOST, '--port', str(args.port + i), '--test']
+        if i == 0:
+            command += ['--id', '0']
+        log = open(os.path.join(args.logs, f'node{i}.log'), 'w') if args.logs else subprocess.DEVNULL
+        # a session of its own, so that the node can be stopped along with its mining processes
+        processes.append(subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT,
+                                          start_new_session=True))
+        if log is not subprocess.DEVNULL:
+            log.close()
+        # the others register to the bootstrap node as soon as they start
+        wait_alive(f'http://{HOST}:{args.port + i}', processes[-1])
+    return processes
+
+
+def wait_alive(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'node at {url} exited with {process.returncode}')
+        try:
+            requests.get(f'{url}/', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f'node at {url} did not start in {timeout}s')
+
+
+def stop(processes):
+    for process in processes:
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for process in processes:
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+
+def replayed(nodes):
+    # (transactions, failed) once every node has gone through its file, None before
+    # a node writes its results file as it goes, so its lines are counted against the ones of its input
+    transactions = failed = 0
+    for i in range(nodes):
+        with open(f'transactions/{nodes}nodes/transactions{i}.txt') as f:
+            expected = sum(1 for line in f if line.strip())
+        try:
+            with open(f'results/result_{i}.txt') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+        if len(lines) < expected:
+            return None
+        transactions += len(lines)
+        failed += sum(line.endswith('failed') for line in lines)
+    return transactions, failed
+
+
+def pending(url):
+    return requests.get(f'{url}/transactions/get', timeout=5).json()['length']
+
+
+def settled(urls, watchers, capacity, quiet):
+    # no tip changed for quiet seconds and every node has too few pending transactions to fill another
+    # block, nodes left with different tips of the same length stay so
+    last = max((when for x in watchers for when in x.seen.values()), default=time.time())
+    if time.time() - last < quiet:
+        return False
+    try:
+        return all(pending(url) < capacity for url in urls)
+    except requests.RequestException:
+        return False
+
+
+def measure(chain, seen, nodes, capacity, difficulty, deadline, target, transactions, failed, same_chains):
+    position = {block.hash: i for i, block in enumerate(chain)}
+    # a block is confirmed once a node is seen with it or a later block of the chain at its tip
+    confirmed_at = [math.inf] * len(chain)
+    for block_hash, when in seen.items():
+        if block_hash in position:
+            confirmed_at[position[block_hash]] = min(confirmed_at[position[block_hash]], when)
+    for i in reversed(range(len(chain) - 1)):
+        confirmed_at[i] = min(confirmed_at[i], confirmed_at[i + 1])
+
+    # the first N - 1 transactions give every node its coins, the replay starts after them
+    ignore = nodes - 1
+    latencies = []
+    created = []
+    first = None
+    for i, block in enumerate(chain[1:], 1):
+        for t in block.listOfTransactions:
+            if ignore:
+                ignore -= 1
+                continue
+            first = first or i
+            created.append(t.timestamp)
+            latencies.append(confirmed_at[i] - t.timestamp)
+
+    result = dict(nodes=nodes, capacity=capacity, difficulty=difficulty, deadline=deadline, target=target,
+                  transactions=transactions, failed=failed, confirmed=len(latencies), blocks=len(chain),
+                  same_chains=same_chains, final_difficulty=chain[-1].difficulty)
+    if latencies:
+        duration = confirmed_at[-1] - min(created)
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 \
+            else latencies * 99
+        # intervals between the blocks of the replay, starting from the last one giving out coins
+        times = confirmed_at[first - 1:]
+        intervals = [b - a for a, b in zip(times, times[1:])]
+        result.update(duration=duration, throughput=len(latencies) / duration, latency_p50=percentiles[49],
+                      latency_p95=percentiles[94], latency_p99=percentiles[98],
+                      block_interval=statistics.mean(intervals) if intervals else None)
+    return result
+
+
+def run(args, nodes, capacity, difficulty, deadline, target):
+    from Wire import decode_chain
+
+    for name in glob.glob('results/result_*.txt'):
+        os.remove(name)
+    urls = [f'http://{HOST}:{args.port + i}' for i in range(nodes)]
+    watchers = [Watcher(url, args.interval) for url in urls]
+    processes = []
+    try:
+        for x in watchers:
+            x.start()
+        processes = start(args, nodes, capacity, difficulty, deadline, target)
+        give_up = time.time() + args.timeout
+        counts = None
+        while time.time() < give_up:
+            counts = counts or replayed(nodes)
+            if counts and settled(urls, watchers, capacity, args.quiet):
+                break
+            time.sleep(1)
+        else:
+            print(f'N={nodes} capacity={capacity} difficulty={difficulty} deadline={deadline} target={target} did not '
+                  f'settle in {args.timeout}s', file=sys.stderr)
+        for x in watchers:
+            x.done.set()
+        chain = decode_chain(requests.get(f'{urls[0]}/getChain/', timeout=30).content)
+        same_chains = len({x.tip for x in watchers}) == 1
+    finally:
+        for x in watchers:
+            x.done.set()
+        stop(processes)
+
+    seen = {}
+    for x in watchers:
+        for block_hash, when in x.seen.items():
+            seen[block_hash] = min(seen.get(block_hash, when), when)
+    transactions, failed = counts or (0, 0)
+    return measure(chain, seen, nodes, capacity, difficulty, deadline, target, transactions, failed, same_chains)
+
+
+def show(result=None):
+    # a row of the table, or its header if there is no result
+    cells = []
+    for x in FIELDS:
+        width = max(len(x), 8)
+        value = x if result is None else result.get(x)
+        if isinstance(value, float):
+            cells.append(f'{value:>{width}.3f}')
+        else:
+            cells.append(f'{"-" if value is None else value!s:>{width}}')
+    print(' '.join(cells))
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--nodes', nargs='+', default=[5], type=int,
+                        help='numbers of nodes, transactions/{N}nodes has to exist for each')
+    parser.add_argument('-c', '--capacity', nargs='+', default=[1, 5, 10], type=int, help='transactions per block')
+    parser.add_argument('-d', '--difficulty', nargs='+', default=[4], type=int, help='mining difficulties')
+    parser.add_argument('-D', '--deadline', nargs='+', default=[0], type=float,
+                        help='seconds after which a block which isn\'t full is mined, 0 for never')
+    parser.add_argument('-T', '--target', nargs='+', default=[0], type=float,
+                        help='target seconds between blocks the difficulty is retargeted toward, 0 for a fixed one')
+    parser.add_argument('-p', '--port', default=5000, type=int, help='port of the bootstrap node, the rest follow')
+    parser.add_argument('-w', '--workers', default=1, type=int, help='mining processes of every node')
+    parser.add_argument('-i', '--interval', default=0.1, type=float, help='seconds between polls of every tip')
+    parser.add_argument('-q', '--quiet', default=5, type=float,
+                        help='seconds without a new tip after which a run is over')
+    parser.add_argument('-t', '--timeout', default=1800, type=float, help='seconds a run may last')
+    parser.add_argument('--logs', default=None, help='directory to keep the output of every node in')
+    parser.add_argument('--json', default=None, help='file to write the results to as JSON')
+    parser.add_argument('--csv', default=None, help='file to write the results to as CSV')
+    args = parser.parse_args()
+
+    # decoding chains doesn't depend on the configuration, but importing Wire needs one
+    os.environ.update(configure(args, args.nodes[0], args.capacity[0], args.difficulty[0], args.deadline[0],
+                                args.target[0]))
+    # stop the nodes when stopped, not just when interrupted
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(1))
+    if args.logs:
+        os.makedirs(args.logs, exist_ok=True)
+    results = []
+    show()
+    for nodes, capacity, difficulty, deadline, target in product(args.nodes, args.capacity, args.difficulty,
+                                                                 args.deadline, args.target):
+        results.append(run(args, nodes, capacity, difficulty, deadline, target))
+        show(results[-1])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
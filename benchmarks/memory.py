@@ -0,0 +1,52 @@
+import gc
+import tracemalloc
+from benchmarks.synthetic import make_wallets, make_chain
+from UTXOSet import UTXOSet
+
+# run from the repository's root: python3 -m benchmarks.memory [--transactions 10000 100000]
+
+
+def retained(build):
+    # bytes still allocated by build's result once everything temporary is freed
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def measure(wallets, transactions, capacity):
+    blocks = transactions // capacity
+    # fake signatures, mining at difficulty 1: only the size of the objects matters here
+    chain, chain_bytes = retained(lambda: make_chain(wallets, blocks, capacity, 1, sign=False))
+    confirmed = [t for block in chain[1:] for t in block.listOfTransactions]
+
+    def index():
+        NBCs = UTXOSet()
+        for t in confirmed:
+            for x in t.transaction_outputs:
+                NBCs.add(x)
+        return NBCs
+
+    _, utxo_bytes = retained(index)
+    # a block costs its header plus its transactions, every output is also held by the UTXO set
+    print(f'{len(confirmed):>12} {capacity:>9} {chain_bytes / len(confirmed):>14.0f} '
+          f'{chain_bytes / blocks:>12.0f} {utxo_bytes / len(confirmed):>14.0f}')
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('-t', '--transactions', nargs='+', default=[10000, 100000], type=int,
+                        help='numbers of transactions in the benchmarked chains')
+    parser.add_argument('-c', '--capacity', default=5, type=int, help='transactions per block')
+    args = parser.parse_args()
+
+    wallets = make_wallets()
+    print(f'{"transactions":>12} {"capacity":>9} {"bytes per tx":>14} {"per block":>12} {"utxo per tx":>14}')
+    for count in args.transactions:
+        measure(wallets, count, args.capacity)
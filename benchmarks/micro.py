@@ -0,0 +1,176 @@
+import json
+import sys
+import threading
+import time
+import jsonpickle
+from benchmarks.synthetic import make_wallets, make_chain
+from Block import Block, target
+from Blockchain import Blockchain
+from Node import Node
+from Transaction import Transaction
+from UTXOSet import UTXOSet
+
+# run from the repository's root:
+# python3 -m benchmarks.micro [--blocks BLOCKS] [--pow-time SECONDS] [--save FILE] [--compare FILE [--threshold FRACTION]]
+
+
+def timed(run, repeat, setup=None):
+    # seconds per call of run, setup is called before every call and isn't timed
+    total = 0.0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        total += time.perf_counter() - start
+    return total / repeat
+
+
+def make_node(wallets, blocks):
+    # a node of the ring of wallets whose state is the one after blocks
+    node = Node(1, '127.0.0.1', 5001)
+    node.wallet = wallets[1]
+    node.update(1, Blockchain.from_blocks(blocks))
+    node.set_ring([('127.0.0.1', 5000 + i, x.public_key) for i, x in enumerate(wallets)])
+    return node
+
+
+def forget_signatures(node):
+    # every signature is verified again, parsed public keys are still remembered
+    node.verifier.verified.entries.clear()
+
+
+def reset(node):
+    # the state of a node which has just joined, before validate_chain
+    node.NBCs = UTXOSet()
+    for i, x in enumerate(node.ring):
+        node.index_node(i, x[2])
+    node.wallet.balance = 0
+    forget_signatures(node)
+
+
+def suite(args):
+    # (name, seconds per call) of every benchmark, the fastest of args.rounds rounds
+    wallets = make_wallets()
+    chain = make_chain(wallets, args.blocks, args.capacity)
+    last = chain[-1]
+    node = make_node(wallets, chain[:-1])
+    first = last.listOfTransactions[0]
+    sender = wallets[[x.address for x in wallets].index(first.sender_address)]
+    inputs = list(node.NBCs.unspent(sender.address))[:1]
+
+    def undo():
+        node.undo_NBCs(first, spent.pop())
+
+    spent = []
+    encoded_block = jsonpickle.encode(last)
+    encoded_chain = jsonpickle.encode(keys=True, value={'chain': chain})
+    benchmarks = [
+        ('Block.myHash', lambda: timed(last.myHash, 10000)),
+        ('Transaction.__init__', lambda: timed(
+            lambda: Transaction(sender.address, sender.signer, wallets[0].address, 1, inputs), 20)),
+        ('validate_transaction', lambda: timed(
+            lambda: node.validate_transaction(first), 200, lambda: forget_signatures(node))),
+        ('update_NBCs', lambda: timed(
+            lambda: spent.append(node.update_NBCs(first)), 10000, lambda: spent and undo())),
+        # transactions of a block are validated as it's applied, the block is rolled back before the next call
+        ('validate_block', lambda: timed(
+            lambda: node.validate_block(last) and node.apply_block(last, validate=True), 50,
+            lambda: (node.rollback(len(chain) - 1), forget_signatures(node)))),
+        ('validate_chain', lambda: timed(lambda: node.validate_chain(chain), 1, lambda: reset(node))),
+        ('jsonpickle encode block', lambda: timed(lambda: jsonpickle.encode(last), 1000)),
+        ('jsonpickle decode block', lambda: timed(lambda: jsonpickle.decode(encoded_block), 1000)),
+        ('jsonpickle encode chain', lambda: timed(
+            lambda: jsonpickle.encode(keys=True, value={'chain': chain}), 3)),
+        ('jsonpickle decode chain', lambda: timed(lambda: jsonpickle.decode(encoded_chain, keys=True), 3)),
+    ]
+
+    assert node.validate_block(last), 'the synthetic block must be valid'
+    results = {}
+    for name, run in benchmarks:
+        results[name] = min(run() for _ in range(args.rounds))
+        if spent:
+            undo()
+
+    # a single hash of the workers: they search for at least --pow-time seconds for a nonce below a target of
+    # 0, which none meets, so handing out the jobs is a negligible part of the time they report
+    rates = []
+    for _ in range(args.rounds):
+        block = Block(index=last.index + 1, previousHash=last.hash, listOfTransactions=list(last.listOfTransactions))
+        timer = threading.Timer(args.pow_time, node.miner.stop)
+        timer.start()
+        node.miner.mine(block.header(), 0)
+        rates.append(node.miner.hashrate())
+    results['proof_of_work hash'] = 1 / max(rates)
+
+    for difficulty in args.difficulty:
+        # the work of Node.proof_of_work, reported as the mean time of the blocks mined in at least --pow-time
+        # seconds since the time of a single block is random
+        times = []
+        for _ in range(args.rounds):
+            mined = 0
+            start = time.perf_counter()
+            while not mined or time.perf_counter() - start < args.pow_time:
+                block = Block(index=last.index + 1, previousHash=last.hash,
+                              listOfTransactions=list(last.listOfTransactions))
+                node.miner.mine(block.header(), target(4 * difficulty))
+                mined += 1
+            times.append((time.perf_counter() - start) / mined)
+        results[f'proof_of_work (difficulty {difficulty})'] = min(times)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # prints every result along with its baseline and returns the names of the ones slower by more than
+    # threshold (a fraction of the baseline)
+    regressions = []
+    print(f'{"benchmark":<34} {"time (us)":>14} {"baseline (us)":>14} {"change":>8}')
+    for name, seconds in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:<34} {seconds * 1e6:>14.3f} {"-":>14} {"-":>8}')
+            continue
+        change = seconds / before - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = ' regression'
+        print(f'{name:<34} {seconds * 1e6:>14.3f} {before * 1e6:>14.3f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('-b', '--blocks', default=100, type=int, help='blocks of the synthetic chain')
+    parser.add_argument('-c', '--capacity', default=5, type=int, help='transactions per block')
+    parser.add_argument('-d', '--difficulty', nargs='+', default=[1, 2, 3, 4], type=int,
+                        help='difficulties to measure the time of mining a block at')
+    parser.add_argument('-p', '--pow-time', default=1.0, type=float,
+                        help='least seconds proof of work is measured for in every round')
+    parser.add_argument('-r', '--rounds', default=5, type=int, help='rounds of every benchmark, the fastest counts')
+    parser.add_argument('-s', '--save', default=None, help='file to save the results to')
+    parser.add_argument('--compare', default=None, help='file with the results of an earlier run')
+    parser.add_argument('-t', '--threshold', default=0.1, type=float,
+                        help='slowdown relative to the earlier run which counts as a regression')
+    args = parser.parse_args()
+
+    config = {'blocks': args.blocks, 'capacity': args.capacity}
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            earlier = json.load(f)
+        if earlier['config'] != config:
+            print(f'The earlier run used {earlier["config"]}, its results are not comparable', file=sys.stderr)
+            sys.exit(2)
+        baseline = earlier['results']
+
+    results = suite(args)
+    regressions = compare(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'config': config, 'results': results}, f, indent=2)
+    if regressions:
+        print(f'{len(regressions)} regression(s) beyond {args.threshold:.0%}: {", ".join(regressions)}')
+        sys.exit(1)
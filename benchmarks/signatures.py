@@ -0,0 +1,47 @@
+import jsonpickle
+from benchmarks.micro import timed
+from benchmarks.synthetic import make_wallets
+from SignatureScheme import SCHEMES, load_cipher
+from Transaction import Transaction
+from UTXOSet import UTXO
+from Verifier import Verifier
+from Wallet import Wallet
+from Wire import encode_transaction
+
+# run from the repository's root: python3 -m benchmarks.signatures [--schemes rsa ecdsa ed25519] [--repeat REPEAT]
+
+
+def measure(scheme, repeat):
+    # (milliseconds of a key pair, of signing with a parsed and an unparsed private key, of verifying with a
+    # parsed and an unparsed public key, bytes of the public key, of the signature, of a transaction in the
+    # wire format and in jsonpickle)
+    sender, receiver = make_wallets(2, scheme)
+    inputs = [UTXO(b'0' * 16, '0' * 64, sender.address, 100)]
+    keygen = timed(lambda: Wallet(scheme), max(repeat // 10, 1))
+    sign = timed(lambda: Transaction(sender.address, sender.signer, receiver.address, 1, inputs), repeat)
+    sign_unparsed = timed(lambda: Transaction(sender.address, sender.private_key, receiver.address, 1, inputs),
+                          repeat)
+    t = Transaction(sender.address, sender.signer, receiver.address, 1, inputs)
+    verifier = Verifier()
+    assert verifier.verify(t, sender.public_key), 'the signature must be valid'
+    verify = timed(lambda: verifier.verify(t, sender.public_key), repeat, verifier.verified.entries.clear)
+    verify_unparsed = timed(lambda: load_cipher(sender.public_key), repeat) + verify
+    return [x * 1e3 for x in (keygen, sign, sign_unparsed, verify, verify_unparsed)] + \
+        [len(sender.public_key), len(t.signature), len(encode_transaction(t)), len(jsonpickle.encode(t))]
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('-s', '--schemes', nargs='+', default=list(SCHEMES), choices=list(SCHEMES),
+                        help='signature schemes to compare')
+    parser.add_argument('-r', '--repeat', default=200, type=int, help='signatures and verifications per scheme')
+    args = parser.parse_args()
+
+    columns = ['keygen (ms)', 'sign (ms)', 'sign cold', 'verify (ms)', 'verify cold', 'public key', 'signature',
+               'tx wire', 'tx json']
+    print(f'{"scheme":<8} ' + ' '.join(f'{x:>11}' for x in columns))
+    for scheme in args.schemes:
+        values = measure(scheme, args.repeat)
+        print(f'{scheme:<8} ' + ' '.join(f'{x:>11.3f}' if isinstance(x, float) else f'{x:>11}' for x in values))
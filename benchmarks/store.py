@@ -0,0 +1,67 @@
+import os
+import tempfile
+import time
+from benchmarks.memory import retained
+from benchmarks.micro import make_node, reset
+from benchmarks.synthetic import make_wallets, make_chain
+from BlockStore import BlockStore
+from ChainCache import ChainCache
+
+# run from the repository's root: python3 -m benchmarks.store [--blocks BLOCKS] [--capacity CAPACITY]
+
+
+def seconds(run):
+    start = time.perf_counter()
+    result = run()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('-b', '--blocks', default=200, type=int, help='blocks of the benchmarked chain')
+    parser.add_argument('-c', '--capacity', default=5, type=int, help='transactions per block')
+    args = parser.parse_args()
+
+    wallets = make_wallets()
+    chain = make_chain(wallets, args.blocks, args.capacity)
+    blocks = list(chain)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'chain')
+        store = BlockStore(path)
+        _, write = seconds(lambda: store.sync(blocks, len(blocks)))
+        store.close()
+        print(f'write {len(blocks)} blocks: {write * 1e3:.1f} ms, segment {os.path.getsize(path)} bytes')
+
+        # a restart: the index is read and every record is decoded to check it against its hash
+        store, reopen = seconds(lambda: BlockStore(path))
+        assert store.hashes == [x.hash for x in blocks], 'the reopened store must have the same blocks'
+        assert list(store.read()) == blocks, 'stored blocks must decode to the same blocks'
+        print(f'reopen: {reopen * 1e3:.2f} ms')
+
+        # serving the whole chain: the cache keeps every record in memory, the store reads them from the map
+        cache = ChainCache()
+        message, cached_bytes = retained(lambda: cache.chain(blocks, len(blocks)))
+        _, served = seconds(lambda: store.chain(blocks, len(blocks)))
+        assert store.chain(blocks, len(blocks)) == message, 'the store must serve the same message'
+        print(f'/getChain/: {served * 1e3:.2f} ms from the store, {cached_bytes} bytes kept by the cache')
+
+        # validating the chain of the bootstrap node after a restart, with and without the store
+        node = make_node(wallets, blocks[:1])
+        reset(node)
+        _, full = seconds(lambda: node.validate_chain(chain))
+        node.store = store
+        reset(node)
+        valid, resumed = seconds(lambda: node.validate_chain(chain))
+        assert valid, 'the chain must be valid'
+        print(f'validate_chain: {full * 1e3:.1f} ms from scratch, {resumed * 1e3:.1f} ms with the store')
+
+        # a crash in the middle of appending a block: the partial record is dropped on restart
+        store.truncate(len(blocks) - 1)
+        store.close()
+        with open(path, 'ab') as f:
+            f.write(b'\0\0\1\0partial')
+        store = BlockStore(path)
+        assert len(store) == len(blocks) - 1 and store.size == os.path.getsize(path), 'partial record must go'
+        store.close()
@@ -0,0 +1,86 @@
+import os
+import time
+from types import SimpleNamespace
+
+# modules of the node read their configuration at import
+os.environ.setdefault('N', '5')
+os.environ.setdefault('CAPACITY', '5')
+os.environ.setdefault('MINING_DIFFICULTY', '1')
+
+from Block import Block, target
+from Blockchain import Blockchain
+from Transaction import Transaction, transaction_hash
+from UTXOSet import UTXOSet
+from Wallet import Wallet, SIGNATURE_SCHEME
+
+# synthetic wallets, transactions and chains shared by the benchmarks
+
+
+def make_wallets(count=int(os.environ['N']), scheme=SIGNATURE_SCHEME):
+    return [Wallet(scheme) for _ in range(count)]
+
+
+def make_transaction(sender, receiver, amount, inputs, sign=True):
+    # same as Transaction(...), with a cached private key or a random signature
+    t = Transaction.__new__(Transaction)
+    t.sender_address = sender.address
+    t.receiver_address = receiver.address
+    t.amount = amount
+    t.timestamp = time.time()
+    t.transaction_id = transaction_hash(t.sender_address, t.receiver_address, amount, t.timestamp)
+    t.transaction_inputs = tuple(inputs)
+    t.transaction_outputs = t.create_transaction_outputs()
+    signature = sender.signer.sign(t.transaction_id) if sign else os.urandom(sender.scheme.signature_size)
+    t.transaction_id = t.transaction_id.hexdigest()
+    t.signature = signature
+    return t
+
+
+def mine(block, difficulty):
+    # difficulty in leading zero bits of the hash
+    block.difficulty = difficulty
+    while int(block.myHash(), 16) >= target(difficulty):
+        block.nonce += 1
+    block.hash = block.myHash()
+    return block.seal()
+
+
+def make_transactions(wallets, count, NBCs, sign=True):
+    # the first wallet gives 100 coins to each of the others, then every wallet pays 1 coin to the next one
+    transactions = []
+    for i in range(count):
+        if i < len(wallets) - 1:
+            sender, receiver, amount = wallets[0], wallets[i + 1], 100
+        else:
+            sender = wallets[i % len(wallets)]
+            receiver, amount = wallets[(i + 1) % len(wallets)], 1
+        inputs, total = [], 0
+        for x in NBCs.unspent(sender.address):
+            inputs.append(x)
+            total += x['amount']
+            if total >= amount:
+                break
+        t = make_transaction(sender, receiver, amount, inputs, sign)
+        for x in t.transaction_inputs:
+            NBCs.spend(x['id'])
+        for x in t.transaction_outputs:
+            NBCs.add(x)
+        transactions.append(t)
+    return transactions
+
+
+def make_chain(wallets, blocks, capacity=int(os.environ['CAPACITY']),
+               difficulty=int(os.environ['MINING_DIFFICULTY']), sign=True):
+    """Builds a valid chain of genesis followed by blocks full blocks, whose genesis gives its coins
+    to the first wallet.
+    """
+    NBCs = UTXOSet()
+    node = SimpleNamespace(id=0, wallet=wallets[0], NBCs=NBCs, block=None)
+    chain = Blockchain(node)
+    chain.rebuild_index()
+    transactions = make_transactions(wallets, blocks * capacity, NBCs, sign)
+    for i in range(blocks):
+        block = Block(index=chain[-1].index + 1, previousHash=chain[-1].hash,
+                      listOfTransactions=transactions[i * capacity:(i + 1) * capacity])
+        chain.add_block(mine(block, 4 * difficulty))
+    return chain
@@ -0,0 +1,59 @@
+import time
+import uuid
+from collections import OrderedDict
+from UTXOSet import UTXOSet
+
+# run from the repository's root: python3 -m benchmarks.utxo
+
+OWNER = b'-----BEGIN PUBLIC KEY-----owner'
+OTHER = b'-----BEGIN PUBLIC KEY-----other'
+ROUNDS = 1000
+
+
+def output(owner, amount=1):
+    return OrderedDict({'id': uuid.uuid4(), 'trans_id': uuid.uuid4().hex, 'receiver': owner, 'amount': amount})
+
+
+def list_round(NBCs, spent):
+    # what validate_transaction and update_NBCs used to do with a list of outputs per owner
+    assert spent in NBCs[OWNER]
+    change = output(OWNER)
+    NBCs[OWNER].append(change)
+    NBCs[OWNER] = list(filter(lambda x: x['id'] != spent['id'], NBCs[OWNER]))
+    NBCs[OTHER].append(output(OTHER))
+    sum(x['amount'] for x in NBCs[OWNER])
+    return change
+
+
+def set_round(NBCs, spent):
+    assert NBCs.get(spent['id']) == spent
+    change = output(OWNER)
+    NBCs.spend(spent['id'])
+    NBCs.add(change)
+    NBCs.add(output(OTHER))
+    NBCs.balance(OWNER)
+    return change
+
+
+def measure(size):
+    # the owner holds size outputs and every round spends the newest one
+    outputs = [output(OWNER) for _ in range(size)]
+    NBCs_list = {OWNER: list(outputs), OTHER: []}
+    NBCs_set = UTXOSet()
+    for x in outputs:
+        NBCs_set.add(x)
+    results = []
+    for NBCs, do_round in ((NBCs_list, list_round), (NBCs_set, set_round)):
+        spent = outputs[-1]
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            spent = do_round(NBCs, spent)
+        results.append((time.perf_counter() - start) / ROUNDS * 1e6)
+    return results
+
+
+if __name__ == '__main__':
+    print(f'{"outputs":>8} {"list (us/tx)":>14} {"UTXOSet (us/tx)":>16}')
+    for size in (1, 10, 100, 500, 1000, 5000):
+        list_time, set_time = measure(size)
+        print(f'{size:>8} {list_time:>14.2f} {set_time:>16.2f}')
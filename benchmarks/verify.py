@@ -0,0 +1,41 @@
+import os
+import time
+from benchmarks.synthetic import make_wallets, make_chain
+from benchmarks.micro import make_node, reset
+from Verifier import Verifier
+
+# run from the repository's root: python3 -m benchmarks.verify [--blocks BLOCKS] [--workers WORKERS ...]
+
+
+def measure(node, chain, workers):
+    # seconds to validate the chain from scratch with signatures checked by the given number of processes
+    node.verifier = Verifier(workers=workers)
+    reset(node)
+    # the processes are started (and public keys parsed) once, not every time a chain is validated
+    node.verify_signatures(list(chain[1].listOfTransactions))
+    reset(node)
+    start = time.perf_counter()
+    assert node.validate_chain(chain)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('-b', '--blocks', default=200, type=int, help='blocks of the benchmarked chain')
+    parser.add_argument('-c', '--capacity', default=5, type=int, help='transactions per block')
+    parser.add_argument('-w', '--workers', nargs='+', type=int,
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}), help='numbers of verifying processes')
+    args = parser.parse_args()
+
+    wallets = make_wallets()
+    chain = make_chain(wallets, args.blocks, args.capacity)
+    node = make_node(wallets, chain[:1])
+    transactions = args.blocks * args.capacity
+    print(f'{"workers":>8} {"chain (s)":>10} {"per tx (us)":>12} {"speedup":>8}')
+    base = None
+    for workers in args.workers:
+        seconds = measure(node, chain, workers)
+        base = base or seconds
+        print(f'{workers:>8} {seconds:>10.3f} {seconds / transactions * 1e6:>12.1f} {base / seconds:>8.2f}')
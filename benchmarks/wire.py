@@ -0,0 +1,42 @@
+import time
+import jsonpickle
+from benchmarks.synthetic import make_wallets, make_chain
+from Wire import encode_block, decode_block, encode_chain, decode_chain
+
+# run from the repository's root: python3 -m benchmarks.wire [--blocks BLOCKS]
+
+
+def timed(function, value, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(value)
+    return result, (time.perf_counter() - start) / repeat * 1e3
+
+
+def compare(name, value, encoders, repeat):
+    # encoders = ((name, encode, decode), ...)
+    for encoder, encode, decode in encoders:
+        data, encode_time = timed(encode, value, repeat)
+        _, decode_time = timed(decode, data, repeat)
+        print(f'{name:<16} {encoder:<11} {len(data):>12} {encode_time:>12.3f} {decode_time:>12.3f}')
+
+
+if __name__ == '__main__':
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument('-b', '--blocks', default=1000, type=int, help='blocks of the benchmarked chain')
+    args = parser.parse_args()
+
+    wallets = make_wallets()
+    print(f'{"payload":<16} {"format":<11} {"bytes":>12} {"encode (ms)":>12} {"decode (ms)":>12}')
+    for capacity in (1, 5, 10):
+        block = make_chain(wallets, 1, capacity, sign=False)[-1]
+        compare(f'block (cap {capacity})', block,
+                (('jsonpickle', jsonpickle.encode, jsonpickle.decode), ('wire', encode_block, decode_block)), 200)
+    for capacity in (1, 5, 10):
+        chain = make_chain(wallets, args.blocks, capacity, sign=False)
+        compare(f'chain (cap {capacity})', chain,
+                (('jsonpickle', lambda c: jsonpickle.encode(keys=True, value={'chain': c}),
+                  lambda d: jsonpickle.decode(d, keys=True)['chain']),
+                 ('wire', encode_chain, decode_chain)), 3)
@@ -1,10 +1,10 @@
-import jsonpickle
 import numpy as np
 import requests
 import netifaces as ni
 from dotenv import load_dotenv
 import os
 import time
+from Wire import decode_chain
 
 load_dotenv()
 N = int(os.getenv("N"))
@@ -32,7 +32,7 @@ def do_trans():
                 continue
             url = f'http://{addr[:-1]}{addr_last}:{node_port}/getChain/'
             r = requests.get(url)
-            info = jsonpickle.decode(r.json(), keys=True)['chain']
+            info = decode_chain(r.content)
 
             # we will ignore genesis and initial 100s transactions i.e. first 4 or 9 trans
             if addr_last == 1 and node_port == 5000: